@@ -122,3 +122,36 @@ CORS_ALLOW_CREDENTIALS = True  # 指明在跨域访问中，后端是否支持
 
 # 配置MEDIA_ROOT
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
+
+# PDF处理的进程数, 大于1时按页多进程处理
+PDF_PROCESSING_NUMBER = int(os.environ.get("PDF_PROCESSING_NUMBER", 1))
+
+# 页面缓存, 同一份PDF再次分析时直接读取缓存的识别结果
+PAGE_CACHE_PATH = os.path.join(MEDIA_ROOT, "page_cache.sqlite3")
+PAGE_CACHE_MAX_SIZE = int(os.environ.get("PAGE_CACHE_MAX_SIZE", 1024 * 1024 * 1024)) # 缓存的最大字节数
+
+# 是否根据页面特征自适应选择PDF渲染的缩放比例
+PDF_ADAPTIVE_ZOOM = os.environ.get("PDF_ADAPTIVE_ZOOM", "0") == "1"
+
+# OCR页面的文字行是否交给批处理服务识别, 多个请求共用同一个识别模型
+PDF_BATCH_RECOGNITION = os.environ.get("PDF_BATCH_RECOGNITION", "0") == "1"
+
+# 有文本层的页面是否延迟版面分析, 只有包含关键词的页面在统计图表数量时才进行版面分析
+PDF_LAZY_LAYOUT = os.environ.get("PDF_LAZY_LAYOUT", "0") == "1"
+
+# OCR页面是否先低分辨率初筛, 只有命中主题词的页面以正常分辨率识别
+PDF_CASCADE_OCR = os.environ.get("PDF_CASCADE_OCR", "0") == "1"
+PDF_TRIAGE_ZOOM = float(os.environ.get("PDF_TRIAGE_ZOOM", 1.0)) # 初筛的缩放比例
+
+# 有文本层的页面是否根据PDF中的图片、矢量图形和表格线统计图表数量, 不使用版面分析模型
+PDF_VECTOR_COUNTING = os.environ.get("PDF_VECTOR_COUNTING", "0") == "1"
+
+# 上传PDF后是否立即在后台识别, 识别结果写入页面缓存, calculate 时直接读取
+PDF_BACKGROUND_OCR = os.environ.get("PDF_BACKGROUND_OCR", "1") == "1"
+PDF_BACKGROUND_WORKERS = int(os.environ.get("PDF_BACKGROUND_WORKERS", 1)) # 同时进行后台识别的PDF数
+PDF_JOB_TTL = int(os.environ.get("PDF_JOB_TTL", 3600)) # 结束的后台识别任务保留的秒数, 之后不能再查询状态
+PDF_TIME_ESTIMATOR_PATH = os.path.join(MEDIA_ROOT, "time_estimator.json") # 按实际耗时校准的处理时间估计
+
+# jieba分词缓存, 相同的句子只分词一次; 设置 JIEBA_CACHE_PATH 时保存到文件, 重启后继续使用
+JIEBA_CACHE_SIZE = int(os.environ.get("JIEBA_CACHE_SIZE", 200000)) # 最多缓存的句子数
+JIEBA_CACHE_PATH = os.environ.get("JIEBA_CACHE_PATH", "")
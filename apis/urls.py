@@ -3,6 +3,7 @@ from . import view as api_views
 
 urlpatterns = [
     path('upload_pdfs', api_views.upload_pdfs, name='upload_pdfs'),
+    path('pdf_job_status', api_views.get_pdf_job_status, name='pdf_job_status'),
     path('indicators', api_views.get_indicators, name='indicators'),
     path('add_indicators', api_views.add_indicators, name='add_indicators'),
     path('calculate', api_views.calculate, name='calculate'),
@@ -1,3 +1,3 @@
 from .indicator import add_indicators, get_indicators, process_keywords
-from .pdf_upload import upload_pdfs
+from .pdf_upload import upload_pdfs, get_pdf_job_status
 from .result import calculate
@@ -7,6 +7,7 @@ from django.views.decorators.csrf import csrf_exempt
 
 from common.base.base_respons import retJson
 from common.custom.logger import my_logger
+from common.custom.pdf_jobs import submit_pdf_job, get_pdf_job, create_pdf_processor, estimate_processing_time
 
 @csrf_exempt
 def upload_pdfs(request):
@@ -17,6 +18,9 @@ def upload_pdfs(request):
         files: pdf文件列表
     返回值:
         filepaths: list[string] pdf文件路径列表
+        predicted_time: int 预测耗时(分钟), 根据实际处理耗时校准, 包括排在前面的后台任务
+        predicted_seconds: float 预测耗时(秒)
+        jobs: list[dict] 每个pdf的后台识别任务, 见 PdfJob.to_dict, 未开启后台识别时为空
     """
     if request.method == 'GET':
         my_logger.error("请使用POST方法")
@@ -46,7 +50,7 @@ def upload_pdfs(request):
 
             # 保存pdf文件
             filepaths = []
-            page_count = 0
+            page_counts = []
             for file in files:
                 file_path = os.path.join(pdf_dir, file.name)
                 if file_path in filepaths:
@@ -60,13 +64,45 @@ def upload_pdfs(request):
                         f.write(chunk)
                 
                 # 获取PDF页数
-                pdf_document = fitz.open(file_path)
-                page_count += pdf_document.page_count
-            
+                with fitz.open(file_path) as pdf_document:
+                    page_counts.append(pdf_document.page_count)
+
+            # 后台识别, 用户填写页码等参数的同时进行OCR
+            jobs = []
+            if settings.PDF_BACKGROUND_OCR:
+                jobs = [submit_pdf_job(file_path, page_count).to_dict() for file_path, page_count in zip(filepaths, page_counts)]
+                # 后台任务依次排队, 最后一个任务的预测时间包括前面的任务
+                predicted_seconds = max([job["predicted_seconds"] for job in jobs])
+            else:
+                predicted_seconds = 0.0
+                for file_path in filepaths:
+                    pdf = create_pdf_processor(file_path)
+                    predicted_seconds += estimate_processing_time(pdf)
+                    pdf.close_pdfplumber()
+
             # 预测耗时(分钟)
-            predicted_time = int(page_count * 15 / 60)
+            predicted_time = int(predicted_seconds / 60)
             my_logger.info(f"上传pdf文件成功")
-            return retJson(code=1, msg="success", data={"filepaths": filepaths, "predicted_time": predicted_time})
+            return retJson(code=1, msg="success", data={"filepaths": filepaths, "predicted_time": predicted_time, "predicted_seconds": round(predicted_seconds, 1), "jobs": jobs})
         except Exception as e:
             my_logger.error(f"{str(logging.exception(e))}")
-            return retJson(code=0, msg=str(e))
\ No newline at end of file
+            return retJson(code=0, msg=str(e))
+
+@csrf_exempt
+def get_pdf_job_status(request):
+    """
+    描述：查询上传pdf后的后台识别任务状态
+    方法：GET
+    参数：
+        job_id: string 任务ID, upload_pdfs 返回的 jobs 中的 job_id
+    返回值:
+        job: dict 任务状态, 见 PdfJob.to_dict
+    """
+    if request.method != 'GET':
+        my_logger.error("请使用GET方法")
+        return retJson(code=0, msg="请使用GET方法")
+    job = get_pdf_job(job_id=request.GET.get('job_id'))
+    if job is None:
+        my_logger.error("任务不存在")
+        return retJson(code=0, msg="任务不存在")
+    return retJson(code=1, msg="success", data={"job": job.to_dict()})
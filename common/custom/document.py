@@ -0,0 +1,216 @@
+'''
+Document、Page、Block类
+PdfProcessor 提取结果的紧凑表示, 替代 document_info 中每一页的dict
+'''
+
+
+class Block():
+    '''
+    描述：
+        版面中的一个文字块及其下方的图片数量和表格数量, 对应 page_info["new_structure"] 中的一项
+        文字块内容出现在页面内容中时只保存起止位置, 不重复保存文本
+    参数：
+        content: 文字块内容
+        image_count: 文字块下方的图片数量
+        table_count: 文字块下方的表格数量
+        source: 页面内容, 用于查找文字块内容的位置
+        offset: 从页面内容的这个位置开始查找
+    '''
+    __slots__ = ("_source", "_start", "_end", "image_count", "table_count")
+    keys = ("content", "image_count", "table_count")
+
+    def __init__(self, content, image_count=0, table_count=0, source=None, offset=0) -> None:
+        start = -1
+        if source is not None and content != "":
+            start = source.find(content, offset)
+            start = source.find(content) if start == -1 else start
+        if start == -1:
+            self._source, self._start, self._end = content, 0, len(content)
+        else:
+            self._source, self._start, self._end = source, start, start + len(content)
+        self.image_count = image_count
+        self.table_count = table_count
+
+    @property
+    def content(self):
+        return self._source[self._start: self._end]
+
+    def __getitem__(self, key):
+        # 兼容 item["content"] 的访问方式
+        if key not in self.keys:
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def to_dict(self):
+        """
+        描述：转换为 new_structure 中的dict
+        """
+        return {"content": self.content, "image_count": self.image_count, "table_count": self.table_count}
+
+    @classmethod
+    def from_dict(cls, item, source=None, offset=0):
+        """
+        描述：从 new_structure 中的dict创建
+        """
+        return cls(item["content"], item["image_count"], item["table_count"], source, offset)
+
+
+class Page():
+    '''
+    描述：
+        PDF的一页, 对应 document_info 中的 page_info
+        content 在 PdfProcessor 中已经清洗过一次, 使用时不需要再调用 clean_content
+        延迟版面分析的页面, image_count、table_count、blocks 第一次访问时调用 loader 计算
+    参数：
+        pno: 页码
+        content: 页面内容
+        image_count: 图片数量
+        table_count: 表格数量
+        blocks: 每一个文字块及其下方的图片数量和表格数量 List[Block]
+        loader: 版面分析字段还没有计算时使用, 输入 to_dict() 的页面信息, 返回版面分析字段的dict
+        page_type: 页面类型, 见 PdfProcessor
+        tier: 识别的分辨率层级, 见 PdfProcessor
+    '''
+    __slots__ = ("pno", "content", "page_type", "tier", "_image_count", "_table_count", "_blocks", "_loader")
+    keys = ("pno", "content", "image_count", "table_count", "new_structure", "page_type", "tier")
+
+    def __init__(self, pno, content, image_count=None, table_count=None, blocks=None, loader=None, page_type=None, tier=None) -> None:
+        self.pno = pno
+        self.content = content
+        self.page_type = page_type
+        self.tier = tier
+        self._image_count = image_count
+        self._table_count = table_count
+        self._blocks = None if blocks is None else tuple(blocks)
+        self._loader = loader
+
+    @property
+    def has_layout(self):
+        """
+        描述：版面分析字段是否已经计算
+        """
+        return self._blocks is not None
+
+    def load_layout(self):
+        """
+        描述：调用 loader 计算版面分析字段
+        """
+        layout_info = self._loader(self.to_dict()) # 包含 page_type、tier, loader 写回缓存时不会丢失
+        self._image_count = layout_info["image_count"]
+        self._table_count = layout_info["table_count"]
+        self._blocks = self.get_blocks(layout_info["new_structure"], self.content)
+        self._loader = None
+
+    @property
+    def image_count(self):
+        if not self.has_layout:
+            self.load_layout()
+        return self._image_count
+
+    @property
+    def table_count(self):
+        if not self.has_layout:
+            self.load_layout()
+        return self._table_count
+
+    @property
+    def blocks(self):
+        if not self.has_layout:
+            self.load_layout()
+        return self._blocks
+
+    def __getitem__(self, key):
+        # 兼容 page_info["content"] 的访问方式, new_structure 对应 blocks
+        if key not in self.keys:
+            raise KeyError(key)
+        if key == "new_structure":
+            return self.blocks
+        return getattr(self, key)
+
+    @staticmethod
+    def get_blocks(new_structure, content):
+        """
+        描述：把 new_structure 转换为Block, 文字块按顺序在页面内容中查找位置
+        参数：
+            new_structure: List[Dict]
+            content: 页面内容
+        返回值：
+            blocks: Tuple[Block]
+        """
+        blocks = []
+        offset = 0
+        for item in new_structure:
+            block = Block.from_dict(item, content, offset)
+            if block._source is content:
+                offset = block._end
+            blocks.append(block)
+        return tuple(blocks)
+
+    def to_dict(self):
+        """
+        描述：转换为 page_info, 还没有计算的版面分析字段不包含在内
+        """
+        page_info = {"pno": self.pno, "content": self.content}
+        if self.has_layout:
+            page_info["image_count"] = self._image_count
+            page_info["table_count"] = self._table_count
+            page_info["new_structure"] = [block.to_dict() for block in self._blocks]
+        if self.page_type is not None:
+            page_info["page_type"] = self.page_type
+        if self.tier is not None:
+            page_info["tier"] = self.tier
+        return page_info
+
+    @classmethod
+    def from_dict(cls, page_info, loader=None):
+        """
+        描述：
+            从 page_info 创建
+            page_info 缺少版面分析字段时使用 loader, 没有传入时使用 LazyPageInfo 的 loader
+        """
+        if "new_structure" not in page_info:
+            loader = loader or getattr(page_info, "loader", None)
+            if loader is None:
+                raise ValueError(f"第{page_info['pno']}页缺少版面分析结果")
+            return cls(page_info["pno"], page_info["content"], loader=loader, page_type=page_info.get("page_type"), tier=page_info.get("tier"))
+        blocks = cls.get_blocks(page_info["new_structure"], page_info["content"])
+        return cls(page_info["pno"], page_info["content"], page_info["image_count"], page_info["table_count"], blocks,
+                   page_type=page_info.get("page_type"), tier=page_info.get("tier"))
+
+
+class Document():
+    '''
+    描述：
+        PDF文档, 按页码顺序保存每一页的Page
+        可以像 document_info 一样遍历、取下标和切片
+        sentence_index 第一次使用时由 sentence_index.get_sentence_index 构建, 页面内容不变, 之后一直有效
+    参数：
+        pages: List[Page]
+    '''
+    __slots__ = ("pages", "sentence_index")
+
+    def __init__(self, pages) -> None:
+        self.pages = list(pages)
+        self.sentence_index = None # 文档的句子索引 SentenceIndex
+
+    def __len__(self):
+        return len(self.pages)
+
+    def __iter__(self):
+        return iter(self.pages)
+
+    def __getitem__(self, index):
+        return self.pages[index]
+
+    def to_dicts(self):
+        """
+        描述：转换为 document_info List[page_info]
+        """
+        return [page.to_dict() for page in self.pages]
+
+    @classmethod
+    def from_dicts(cls, document_info, loader=None):
+        """
+        描述：从 document_info List[page_info] 创建
+        """
+        return cls([Page.from_dict(page_info, loader) for page_info in document_info])
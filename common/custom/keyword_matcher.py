@@ -0,0 +1,112 @@
+'''
+KeywordMatcher类
+Aho-Corasick 多模式匹配, 一次扫描文本找出所有关键词的出现位置
+'''
+from collections import deque
+from functools import lru_cache
+
+
+class KeywordMatcher():
+    '''
+    描述：
+        由一组关键词构建的 Aho-Corasick 自动机, 构建一次后可以匹配任意多的文本
+        每个字符只转移一次状态, 匹配耗时与文本长度和命中数有关, 与关键词的数量无关
+        空字符串不参与匹配
+    参数：
+        keywords: List[str] 关键词
+    '''
+    def __init__(self, keywords) -> None:
+        self.keywords = list(dict.fromkeys([word for word in keywords if word])) # 去重, 保持原顺序
+        self.goto = [{}] # 每个状态的转移 {字符: 下一个状态}, 0为根节点
+        self.fail = [0] # 每个状态的失败转移
+        self.output = [()] # 每个状态结束的关键词, 包括失败链上的关键词
+
+        # 构建关键词的字典树
+        for word in self.keywords:
+            state = 0
+            for char in word:
+                next_state = self.goto[state].get(char)
+                if next_state is None:
+                    next_state = len(self.goto)
+                    self.goto.append({})
+                    self.fail.append(0)
+                    self.output.append(())
+                    self.goto[state][char] = next_state
+                state = next_state
+            self.output[state] += (word,)
+
+        # 按层次遍历计算失败转移, 第一层的失败转移为根节点
+        states = deque(self.goto[0].values())
+        while states:
+            state = states.popleft()
+            for char, next_state in self.goto[state].items():
+                states.append(next_state)
+                fail_state = self.fail[state]
+                while fail_state and char not in self.goto[fail_state]:
+                    fail_state = self.fail[fail_state]
+                self.fail[next_state] = self.goto[fail_state].get(char, 0)
+                self.output[next_state] += self.output[self.fail[next_state]]
+
+    def iter_hits(self, text):
+        """
+        描述：扫描文本, 按结束位置顺序返回每一次命中
+        参数：
+            text: str 文本
+        返回值：
+            (关键词, 起始位置) 的生成器
+        """
+        goto, fail, output = self.goto, self.fail, self.output
+        state = 0
+        for idx, char in enumerate(text):
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            for word in output[state]:
+                yield word, idx - len(word) + 1
+
+    def find_all(self, text):
+        """
+        描述：获取文本中所有关键词的所有出现位置
+        参数：
+            text: str 文本
+        返回值：
+            hits: List[(关键词, 起始位置)] 按结束位置排序
+        """
+        return list(self.iter_hits(text))
+
+    def find_keywords(self, text):
+        """
+        描述：获取文本中出现的关键词
+        参数：
+            text: str 文本
+        返回值：
+            keywords: set 出现的关键词
+        """
+        return set([word for word, _ in self.iter_hits(text)])
+
+    def search_document(self, document_info):
+        """
+        描述：对文档的每一页扫描一次, 获取所有关键词的出现位置
+        参数：
+            document_info: Document 文档信息
+        返回值：
+            hits: List[(关键词, 页面下标, 起始位置)] 按页面顺序、页面内按结束位置排序
+        """
+        hits = []
+        for idx_page, page_info in enumerate(document_info):
+            hits += [(word, idx_page, offset) for word, offset in self.iter_hits(page_info["content"])]
+        return hits
+
+
+@lru_cache(maxsize=1024)
+def get_keyword_matcher(keywords):
+    """
+    描述：
+        获取关键词的自动机, 同一组关键词只构建一次
+        只用于指标、主题词等反复使用的关键词列表, 每次都不同的文本(例如匹配到的句子)直接创建 KeywordMatcher, 避免缓存一直占用内存
+    参数：
+        keywords: tuple 关键词
+    返回值：
+        matcher: KeywordMatcher
+    """
+    return KeywordMatcher(keywords)
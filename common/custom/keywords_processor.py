@@ -1,9 +1,10 @@
 import re
-import jieba
-from itertools import product
+from collections import defaultdict
 
-from common.custom.pdf_processor import clean_content
 from common.custom.utils import remove_duplicate
+from common.custom.keyword_matcher import KeywordMatcher, get_keyword_matcher
+from common.custom.sentence_index import Paragraph, get_sentence_index
+from common.custom.tokenizer import get_tokenizer
 
 def match_bracket_keywords(keywords_str, type):
     """
@@ -154,19 +155,21 @@ def get_paragraphs_with_keywords(document_info, keywords):
         获取含有特定词语的段落
         这个段落实际是一整页的文本内容
     参数:
-        document_info: 文档信息
+        document_info: Document 文档信息
         keywords: list[特定词语]
     返回值:
         result: List[(段落所在的页码, 段落文本内容)]
     """
     result = [] # 保存结果(pno, paragraph)
 
-    for idx, page_info in enumerate(document_info):
-        content = page_info["content"] # 获取每一页的文本内容
-        content = clean_content(content) # 去除换行符、回车符、制表符、章节号
-        for word in keywords:
-            if word in content:
-                result.append((page_info["pno"], content))
+    sentence_index = get_sentence_index(document_info)
+
+    # 所有关键词一起匹配, 每一页只扫描一次
+    hit_pages = set([idx_page for _, idx_page, _ in get_keyword_matcher(tuple(keywords)).search_document(document_info)])
+    for idx_page in sorted(hit_pages):
+        page_info = document_info[idx_page]
+        content = page_info["content"] # 获取每一页的文本内容, 提取时已经去除换行符、回车符、制表符、章节号
+        result.append((page_info["pno"], get_page_paragraph(sentence_index, idx_page, content)))
     result = remove_duplicate(result) # 去重
     return result
 
@@ -177,7 +180,7 @@ def get_management_speech_paragraphs(document_info, pno_start, pno_end):
         pno_start, pno_end是1开始计数的左闭右闭区间
         因此需要转换为[pno_start-1: pno_end]
     参数:
-        document_info: 文档信息
+        document_info: Document 文档信息
         pno_start: 起始页码
         pno_end: 结束页码
     返回值:
@@ -203,11 +206,13 @@ def get_management_speech_paragraphs(document_info, pno_start, pno_end):
     if pno_end > len(document_info):
         raise ValueError("pno_end can not large than pdf page length")
 
+    sentence_index = get_sentence_index(document_info)
+
     result = [] # 保存结果(pno, paragraph)
-    for page_info in document_info[pno_start-1: pno_end]:
-        content = page_info["content"] # 获取每一页的文本内容
-        content = clean_content(content) # 去除换行符、回车符、制表符、章节号
-        result.append((page_info["pno"], content))
+    for idx_page in range(pno_start-1, pno_end):
+        page_info = document_info[idx_page]
+        content = page_info["content"] # 获取每一页的文本内容, 提取时已经去除换行符、回车符、制表符、章节号
+        result.append((page_info["pno"], get_page_paragraph(sentence_index, idx_page, content)))
     result = remove_duplicate(result) # 去重
     return result
 
@@ -217,56 +222,53 @@ def get_paragraphs_with_keywords_precisely(document_info, keywords, sentence_num
         获取含有特定词语的段落
         这个段落实际是特定词语所在的句子的前后一共 sentence_number 句话
     参数:
-        document_info: 文档信息
+        document_info: Document 文档信息
         keywords: list[特定词语]
     返回值:
         result: List[(段落所在的页码, 段落文本内容)]
     """
-    pattern = r'[^。!！?？]*[。!！?？]' # 定义正则表达式，用于匹配句子
+    sentence_index = get_sentence_index(document_info) # 所有页面的句子, 整个文档只切分一次
+
+    # 所有关键词一起匹配, 每一页只扫描一次
+    # 每个关键词所在的句子, 关键词必须完整地在一个句子中 {页面下标: {关键词: {句子下标}}}
+    page_word_sentences = defaultdict(lambda: defaultdict(set))
+    for word, idx_page, offset in get_keyword_matcher(tuple(keywords)).search_document(document_info):
+        sentence_id = sentence_index.get_sentence_id(idx_page, offset, len(word))
+        if sentence_id is not None:
+            page_word_sentences[idx_page][word].add(sentence_id)
+
     result = [] # 保存结果(pno, paragraph)
-    for idx_page, page_info in enumerate(document_info):
-        content = page_info["content"] # 获取每一页的文本内容
-        content = clean_content(content) # 去除换行符、回车符、制表符、章节号
-        for word in keywords:
-            # 如果当前页的内容中包含关键词，则进行下一步处理
-            if word in content:
-                sentences = re.findall(pattern, content) # 使用正则表达式查找所有句子
-                for idx_sentences, sentence in enumerate(sentences):
-                    if word in sentence:
-                        """
-                        如果关键词在句子中，则把句子的前后一共五句话保存下来
-                        如果句子的前面不足两句话，则从上一页的末尾开始
-                        如果句子的后面不足两句话，则从下一页的开头开始
-                        """
-                        start = idx_sentences - (sentence_number // 2)
-                        end = idx_sentences + (sentence_number - sentence_number // 2)
-                        previous_sentences = [] # 保存前面页的句子
-                        next_sentences = [] # 保存后面页的句子
-                        if start < 0:
-                            previous_sentences_num = 0 - start # 上一页需要的句子数
-                            if idx_page > 0:
-                                previous_page_info = document_info[idx_page - 1] # 上一页的信息
-                                previous_content = previous_page_info["content"] # 上一页的文本内容
-                                previous_content = clean_content(previous_content)
-                                previous_sentences = re.findall(pattern, previous_content) # 上一页的所有句子
-                                previous_sentences = previous_sentences[-previous_sentences_num:] # 从上一页的末尾n个开始
-                            start = 0 # 从当前页的第一句开始
-                        if end > len(sentences):
-                            next_sentences_num = end - len(sentences) # 下一页需要的句子数
-                            if idx_page < len(document_info) - 1:
-                                next_page_info = document_info[idx_page + 1] # 下一页的信息
-                                next_content = next_page_info["content"] # 下一页的文本内容
-                                next_content = clean_content(next_content)
-                                next_sentences = re.findall(pattern, next_content) # 下一页的所有句子
-                                next_sentences = next_sentences[:next_sentences_num] # 从下一页的开头n个开始
-                            end = len(sentences) # 到当前页的最后一句结束
-                        current_sentences = sentences[start: end] # 保存当前页句子
-                        paragraph = " ".join(previous_sentences + current_sentences + next_sentences) # 拼接成段落
-                        result.append((page_info["pno"], paragraph)) # 保存结果
+    for idx_page in sorted(page_word_sentences):
+        page_info = document_info[idx_page]
+        # 与逐个关键词匹配时的顺序一致: 先按关键词顺序, 再按句子顺序
+        for word in dict.fromkeys(keywords):
+            for sentence_id in sorted(page_word_sentences[idx_page][word]):
+                """
+                如果关键词在句子中，则把句子的前后一共五句话保存下来
+                如果句子的前面不足两句话，则从上一页的末尾开始
+                如果句子的后面不足两句话，则从下一页的开头开始
+                """
+                sentence_ids = sentence_index.get_window(sentence_id, idx_page, sentence_number)
+                paragraph = sentence_index.get_paragraph(sentence_ids, separator=" ") # 拼接成段落
+                result.append((page_info["pno"], paragraph)) # 保存结果
 
     result = remove_duplicate(result) # 去重
     return result
 
+def get_page_paragraph(sentence_index, idx_page, content):
+    """
+    描述:
+        把一整页的文本内容作为段落, 附带句子索引中这一页的句子
+    参数:
+        sentence_index: SentenceIndex
+        idx_page: 页面下标
+        content: 页面内容
+    返回值:
+        paragraph: Paragraph
+    """
+    sentence_ids = range(sentence_index.page_starts[idx_page], sentence_index.page_starts[idx_page + 1])
+    return Paragraph(content, sentence_index.get_page_sentences(idx_page), sentence_ids, sentence_index)
+
 def get_sentences_count(sentences):
     """
     描述:
@@ -289,6 +291,7 @@ def get_sentences_with_keywords(pno_paragraphs, keywords_1, keywords_2, keywords
         在筛选出来的段落中找到关键词所在的句（以句号划分）
         keywords_type: single 需要包含1个关键词
         keywords_type: double 同时包含2个关键词
+        来自句子索引的段落通过倒排索引求匹配的句子, 耗时与命中的句子数有关, 与关键词组合的数量无关
     参数:
         pno_paragraphs: List[(pno, paragraph)]
         keywords: List[关键词]
@@ -309,18 +312,32 @@ def get_sentences_with_keywords(pno_paragraphs, keywords_1, keywords_2, keywords
         raise ValueError("keywords_type只能是single或double")
     
     pattern = r'[^。!！?？]*[。!！?？]' # 定义正则表达式，用于匹配句子
-    result_sentences = [] # 保存结果
+    keyword_groups = [keywords_1, keywords_2]
+    # 来自句子索引的段落: 先把用到的句子加入倒排索引, 每个索引只求一次匹配的句子集合
+    sentence_indexes = {} # {id(sentence_index): sentence_index}
+    for _, paragraph in pno_paragraphs:
+        if isinstance(paragraph, Paragraph) and paragraph.sentence_index is not None:
+            paragraph.sentence_index.index_tokens(paragraph.sentence_ids)
+            sentence_indexes[id(paragraph.sentence_index)] = paragraph.sentence_index
+    matched_ids = {key: sentence_index.match(keyword_groups) for key, sentence_index in sentence_indexes.items()} # {id(sentence_index): 匹配的句子下标}
+
+    result_sentences = [] # 保存结果, 按段落和句子的顺序
     for pno, paragraph in pno_paragraphs:
-        # 使用正则表达式查找所有句子的位置
-        sentences = re.findall(pattern, paragraph)
+        if isinstance(paragraph, Paragraph) and paragraph.sentence_index is not None:
+            sentence_index, matched = paragraph.sentence_index, matched_ids[id(paragraph.sentence_index)]
+            for sentence_id in paragraph.sentence_ids:
+                if sentence_id in matched:
+                    result_sentences.append((pno, sentence_index.sentences[sentence_id].strip()))
+            continue
+
+        # 其他段落使用正则表达式查找所有句子
+        sentences = paragraph.sentences if isinstance(paragraph, Paragraph) else re.findall(pattern, paragraph)
         for sentence in sentences:
-            words = jieba.lcut(sentence, cut_all=False)
-            words.append("") # 为了保证keywords_2中的关键词也能匹配到
-            for (word_1, word_2) in list(product(keywords_1, keywords_2)):
-                if word_1 in words and word_2 in words:
-                    sentence = sentence.strip() # 去除首尾空格
-                    result_sentences.append((pno, sentence))
-                    break # 一旦匹配到，就去匹配下一句话
+            sentence = sentence.strip() # 去除首尾空格, 段落中句子之间的空格不参与分词
+            words = set(get_tokenizer().cut(sentence)) # 分词结果缓存, 相同的句子只分词一次
+            words.add("") # 为了保证keywords_2中的关键词也能匹配到
+            if not words.isdisjoint(keywords_1) and not words.isdisjoint(keywords_2):
+                result_sentences.append((pno, sentence))
 
     result_sentences = remove_duplicate(result_sentences) # 去重
     result_sentences = ignore_sentences_with_keywords(result_sentences)
@@ -334,7 +351,7 @@ def get_table_image_count(document_info, keywords_1, keywords_2, keywords_3, key
         keywords_type: single 需要同时包含keywords_2中的关键词
         keywords_type: double 需要同时包含keywords_2和keywords_3中的关键词
     参数：
-        document_info: dict 文档信息
+        document_info: Document 文档信息
         keywords_1: list 关键词
         keywords_2: list 关键词
         keywords_3: list 关键词
@@ -356,23 +373,34 @@ def get_table_image_count(document_info, keywords_1, keywords_2, keywords_3, key
     else:
         raise ValueError("keywords_type只能是single或double")
 
+    def present(words, found):
+        # words 中出现在 found 里的关键词, 空字符串总是出现
+        return set([word for word in words if word == "" or word in found])
+
+    # 页面内容: 所有关键词一起匹配, 每一页只扫描一次, 按页面分组 {页面下标: {出现的关键词}}
+    page_words = defaultdict(set)
+    for word, idx_page, _ in get_keyword_matcher(tuple(keywords_1 + keywords_2 + keywords_3)).search_document(document_info):
+        page_words[idx_page].add(word)
+    block_matcher = get_keyword_matcher(tuple(keywords_2 + keywords_3)) # 文字块中的关键词2和关键词3
+    sentence_matcher = KeywordMatcher(sentences) # 文字块中的句子, 每个指标的句子都不同, 不缓存
+
     table_count = 0
-    image_count = 0 
-    founded_list  = [] # 用于存储已经匹配到的句子
+    image_count = 0
     for idx_page, page_info in enumerate(document_info):
-        content = page_info["content"] # 获取每一页的文本内容
-        content = clean_content(content) # 去除换行符、回车符、制表符、章节号
-        for (word_1, word_2, word_3) in list(product(keywords_1, keywords_2, keywords_3)):
-            # 如果当前页的内容中包含关键词1、关键词2、关键词3, 则进行下一步处理
-            if word_1 in content and word_2 in content and word_3 in content:
-                structure = page_info["new_structure"] # 获取每一页的结构化信息
-                for idx_item, item in enumerate(structure):
-                    # 如果当前句子的内容中包含关键词2和关键词3，且当前句子没有被匹配过，则进行下一步处理
-                    for sentence in sentences:
-                        if word_2 in item["content"] and word_3 in item["content"] and sentence in item["content"] and (idx_page, idx_item) not in founded_list:
-                            founded_list.append((idx_page, idx_item))
-                            table_count += item["table_count"]
-                            image_count += item["image_count"]
+        # 如果当前页的内容中包含关键词1、关键词2、关键词3, 则进行下一步处理
+        found = page_words[idx_page]
+        words_2, words_3 = present(keywords_2, found), present(keywords_3, found)
+        if not present(keywords_1, found) or not words_2 or not words_3:
+            continue
+        structure = page_info["new_structure"] # 获取每一页的结构化信息
+        for item in structure:
+            # 如果当前文字块的内容中包含页面中出现的关键词2和关键词3, 且包含匹配到的句子, 则计入表格和图片数量, 每个文字块只计算一次
+            item_found = block_matcher.find_keywords(item["content"])
+            if not present(words_2, item_found) or not present(words_3, item_found):
+                continue
+            if "" in sentences or next(sentence_matcher.iter_hits(item["content"]), None) is not None:
+                table_count += item["table_count"]
+                image_count += item["image_count"]
     return table_count, image_count
 
 def ignore_sentences_with_keywords(in_sentences):
@@ -387,7 +415,7 @@ def ignore_sentences_with_keywords(in_sentences):
     # 需要去除的关键词
     ignore_words = ["电话","邮箱","邮编","地址"]
     for pno, sentence in in_sentences:
-        words = jieba.cut_for_search(sentence)
+        words = get_tokenizer().cut(sentence, mode="search")
         for word in words:
             if word in ignore_words:
                 in_sentences.remove((pno,sentence))
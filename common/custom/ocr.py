@@ -1,26 +1,55 @@
 import os
 import sys
 import cv2
+import copy
+import time
+import threading
+import paddleocr
 from itertools import chain
 from paddleocr import PPStructure
 from paddleocr import PaddleOCR
 from paddleocr import draw_structure_result
 from paddleocr import save_structure_res
+# paddleocr 导入时会把自身目录加入 sys.path, 之后才能导入 tools
+from tools.infer.predict_system import sorted_boxes
+from tools.infer.utility import get_rotate_crop_image
+
+from common.custom.utils import cv2imread, get_resident_memory, sort_structure
+from common.custom.logger import my_logger
+from common.custom.ocr_service import RecognitionService
+
+# OCR模型版本, 模型变化后缓存的识别结果失效
+OCR_VERSION = f"paddleocr-{getattr(paddleocr, '__version__', 'unknown')}"
+
+# 进程内共享的OCR引擎, 每种配置只加载一次模型
+ocr_engines = {} # {配置: MyOCR}
+ocr_engines_stats = {} # {配置: {"load_time": 加载耗时(秒), "memory": 加载占用的内存(字节)}}
+ocr_engines_lock = threading.Lock()
 
-from common.custom.utils import cv2imread
 class MyOCR():
     """
     描述: 利用paddleocr进行版面分析和文字提取
     """
-    def __init__(self, table=False, ocr=True, show_log=False, image_orientation=False, use_angle_cls=False, use_gpu=False) -> None:
-        self.pdf_engine = PPStructure(table=table, ocr=ocr, show_log=show_log, image_orientation=image_orientation, use_gpu=use_gpu)
-        self.ocr_engine = PaddleOCR(use_angle_cls=use_angle_cls, lang="ch", use_gpu=use_gpu)
+    def __init__(self, table=False, ocr=True, show_log=False, image_orientation=False, use_angle_cls=False, use_gpu=False, cpu_threads=10, rec_batch_size=32, rec_max_wait_ms=10) -> None:
+        self.show_log = show_log
+        self.image_orientation = image_orientation
+        self.use_gpu = use_gpu
+        self.cpu_threads = cpu_threads # CPU推理线程数, 多进程时每个进程应分到 CPU核数/进程数
+        self.pdf_engine = PPStructure(table=table, ocr=ocr, show_log=show_log, image_orientation=image_orientation, use_gpu=use_gpu, cpu_threads=cpu_threads)
+        self.ocr_engine = PaddleOCR(use_angle_cls=use_angle_cls, lang="ch", use_gpu=use_gpu, cpu_threads=cpu_threads)
+        self.layout_engine = None # 只做版面分析的引擎, 第一次使用时才加载
+        self.lock = threading.Lock() # Paddle推理不是线程安全的, 同一个引擎同时只处理一张图片
+        self.rec_batch_size = rec_batch_size # 批量识别: 每批最多识别的文字行数
+        self.rec_max_wait_ms = rec_max_wait_ms # 批量识别: 凑批次时最多等待的毫秒数
+        self.recognition_service = None # 批量识别服务, 第一次使用时才启动
+        self.recognition_service_lock = threading.Lock()
     
-    def get_structure(self, img_path):
+    def get_structure(self, img, scale=1.0):
         """
         描述：进行版面分析和文字提取
         参数：
-            img_path: 图片路径
+            img: 图片路径 或 BGR图像 np.ndarray
+            scale: 坐标缩放比例, 用于把不同分辨率图片的坐标统一到同一坐标系
         返回值：
             structure: 版面分析结果 List[Dict]
             dict 里各个字段说明如下：
@@ -29,32 +58,169 @@ class MyOCR():
                 res: 文本内容，type为text时，res为List[Dict]，包含每行的文本内容，每行的文本内容为Dict，包含text和confidence字段，分别表示文本内容和置信度
         
         """
-        img = cv2imread(img_path)
-        structure = self.pdf_engine(img)
-        
-        # 计算每个item的中心点坐标
-        for item in structure:
-            middle_point = ((item["bbox"][0] + item["bbox"][2])*0.5, (item["bbox"][1] + item["bbox"][3])*0.5)
-            item["middle_point"] = middle_point
+        img = cv2imread(img) if isinstance(img, str) else img
+        with self.lock:
+            structure = self.pdf_engine(img)
+        structure = self.scale_structure(structure, scale)
+        return self.sort_structure(structure)
 
+    def get_layout(self, img, scale=1.0):
         """
-        根据每个item的中心点坐标，对structure进行排序
-        先按y轴升序，y轴相同按x轴升序
-        x轴、y轴坐标都除以100，根据百位数字进行排序
+        描述：只进行版面分析，不进行文字识别
+            用于有文本层的PDF页面，文字直接从PDF中提取
+        参数：
+            img: 图片路径 或 BGR图像 np.ndarray
+            scale: 坐标缩放比例
+        返回值：
+            structure: 版面分析结果 List[Dict]，字段同get_structure，其中res为空
+        """
+        img = cv2imread(img) if isinstance(img, str) else img
+        with self.lock:
+            if self.layout_engine is None:
+                self.layout_engine = PPStructure(table=False, ocr=False, show_log=self.show_log, image_orientation=self.image_orientation, use_gpu=self.use_gpu, cpu_threads=self.cpu_threads)
+            structure = self.layout_engine(img)
+        structure = self.scale_structure(structure, scale)
+        return self.sort_structure(structure)
+
+    def scale_structure(self, structure, scale):
+        """
+        描述：把版面分析结果的坐标乘以缩放比例
+        参数：
+            structure: 版面分析结果 List[Dict]
+            scale: 坐标缩放比例
+        返回值：
+            structure: 缩放后的版面分析结果 List[Dict]
         """
-        structure = sorted(structure, key=lambda x: ((x["middle_point"][1] // 100), (x["middle_point"][0] // 100)))
+        if scale == 1.0:
+            return structure
+        for item in structure:
+            item["bbox"] = [value * scale for value in item["bbox"]]
+            if isinstance(item["res"], list):
+                for line in item["res"]:
+                    if isinstance(line, dict) and "text_region" in line:
+                        line["text_region"] = [[x * scale, y * scale] for x, y in line["text_region"]]
         return structure
+
+    def sort_structure(self, structure):
+        """
+        描述：计算每个item的中心点坐标，并按中心点坐标排序, 见 utils.sort_structure
+        参数：
+            structure: 版面分析结果 List[Dict]
+        返回值：
+            structure: 排序后的版面分析结果 List[Dict]
+        """
+        return sort_structure(structure)
     
-    def get_ocr_result(self, img_path):
+    def get_ocr_result(self, img, scale=1.0):
         '''
         描述：获取paddle ocr的识别结果
         参数：
-            img_path: 图片路径
+            img: 图片路径 或 BGR图像 np.ndarray
+            scale: 坐标缩放比例
         返回值：    
             result: 文字提取结果 List[item]
             item: [[[左上x, 左上y], [右上x, 右上y], [右下x, 右下y], [左下x, 左下y]], (文本, 置信度)]
         '''
-        results = self.ocr_engine.ocr(img_path, cls=False)
+        with self.lock:
+            results = self.ocr_engine.ocr(img, cls=False)
         result = list(chain(*results))
+        if scale != 1.0:
+            result = [[[[x * scale, y * scale] for x, y in line[0]], line[1]] for line in result]
 
-        return result
\ No newline at end of file
+        return result
+
+    def get_recognition_service(self):
+        """
+        描述：获取文字识别批处理服务, 第一次使用时启动, 与引擎共用推理锁
+        返回值：
+            service: RecognitionService
+        """
+        with self.recognition_service_lock:
+            if self.recognition_service is None:
+                self.recognition_service = RecognitionService(
+                    self.ocr_engine.text_recognizer, lock=self.lock,
+                    max_batch_size=self.rec_batch_size, max_wait_ms=self.rec_max_wait_ms)
+        return self.recognition_service
+
+    def get_ocr_result_batched(self, img, scale=1.0):
+        '''
+        描述：
+            获取paddle ocr的识别结果, 结果格式同 get_ocr_result
+            检测在当前线程进行, 文字行图片交给批处理服务, 与其他页面、其他请求的文字行一起识别
+        参数：
+            img: BGR图像 np.ndarray
+            scale: 坐标缩放比例
+        返回值：
+            result: 文字提取结果 List[item]
+        '''
+        return self.get_ocr_results_batched([img], [scale])[0]
+
+    def get_ocr_results_batched(self, imgs, scales=None):
+        '''
+        描述：
+            对多张图片进行文字识别, 每张图片分别检测, 所有图片的文字行一起提交给批处理服务
+            用于双页PDF的左右两部分等需要同时识别的图片
+        参数：
+            imgs: List[BGR图像 np.ndarray]
+            scales: List[坐标缩放比例], None表示都为1.0
+        返回值：
+            results: List[result], 每张图片的结果格式同 get_ocr_result
+        '''
+        scales = [1.0] * len(imgs) if scales is None else scales
+        imgs = [cv2imread(img) if isinstance(img, str) else img for img in imgs]
+        boxes_list = []
+        img_crops = []
+        for img in imgs:
+            with self.lock:
+                dt_boxes, _ = self.ocr_engine.text_detector(img)
+            dt_boxes = [] if dt_boxes is None else sorted_boxes(dt_boxes)
+            boxes_list.append(dt_boxes)
+            img_crops += [get_rotate_crop_image(img, copy.deepcopy(box)) for box in dt_boxes]
+        rec_res = self.get_recognition_service().recognize(img_crops) if len(img_crops) else []
+
+        results = []
+        idx = 0
+        for dt_boxes, scale in zip(boxes_list, scales):
+            result = []
+            for box, (text, score) in zip(dt_boxes, rec_res[idx: idx + len(dt_boxes)]):
+                if score >= self.ocr_engine.drop_score:
+                    result.append([[[x * scale, y * scale] for x, y in box.tolist()], (text, score)])
+            idx += len(dt_boxes)
+            results.append(result)
+        return results
+
+
+def get_ocr_engine(**config):
+    """
+    描述：
+        获取进程内共享的OCR引擎, 同一种配置只在第一次使用时加载模型
+        多个请求线程共用同一个引擎, 引擎内部用锁保证推理安全
+    参数：
+        config: MyOCR的参数, 例如 table、ocr、use_angle_cls、cpu_threads
+    返回值：
+        engine: MyOCR
+    """
+    key = tuple(sorted(config.items()))
+    with ocr_engines_lock:
+        engine = ocr_engines.get(key)
+        if engine is None:
+            memory_before = get_resident_memory()
+            start_time = time.time()
+            engine = MyOCR(**config)
+            stats = {
+                "load_time": time.time() - start_time,
+                "memory": get_resident_memory() - memory_before,
+            }
+            ocr_engines[key] = engine
+            ocr_engines_stats[key] = stats
+            my_logger.info(f"加载OCR引擎 {dict(key)} 耗时 {stats['load_time']:.2f} 秒, 占用内存 {stats['memory'] / 1024 / 1024:.0f} MB")
+    return engine
+
+def get_ocr_engine_stats():
+    """
+    描述：获取已加载的OCR引擎的加载耗时和占用内存
+    返回值：
+        stats: List[{"config": 配置, "load_time": 加载耗时(秒), "memory": 占用内存(字节)}]
+    """
+    with ocr_engines_lock:
+        return [{"config": dict(key), **stats} for key, stats in ocr_engines_stats.items()]
@@ -0,0 +1,107 @@
+'''
+RecognitionService类
+文字识别的批处理服务, 把多个页面、多个请求的文字行图片合并成批次进行识别
+'''
+import time
+import queue
+import threading
+from concurrent.futures import Future
+
+from common.custom.logger import my_logger
+
+
+class RecognitionService():
+    '''
+    描述：
+        文字识别批处理服务
+        调用方提交文字行图片后立即得到Future, 后台线程收集请求,
+        达到 max_batch_size 张或等待超过 max_wait_ms 毫秒后一起识别
+    参数：
+        text_recognizer: PaddleOCR的文字识别器, 输入图片列表, 返回 ([(文本, 置信度)], 耗时)
+        lock: 与检测共用的推理锁, None表示不加锁
+        max_batch_size: 每批最多识别的图片数
+        max_wait_ms: 凑批次时最多等待的毫秒数
+    '''
+    def __init__(self, text_recognizer, lock=None, max_batch_size=32, max_wait_ms=10) -> None:
+        self.text_recognizer = text_recognizer
+        self.lock = lock if lock is not None else threading.Lock()
+        self.max_batch_size = max_batch_size
+        self.max_wait_ms = max_wait_ms
+        self.requests = queue.Queue() # 等待识别的 (图片, Future)
+        self.batch_count = 0 # 已识别的批次数
+        self.image_count = 0 # 已识别的图片数
+        # PaddleOCR内部再按 rec_batch_num 分批, 设置为与服务相同的批大小
+        if hasattr(self.text_recognizer, "rec_batch_num"):
+            self.text_recognizer.rec_batch_num = max_batch_size
+        self.thread = threading.Thread(target=self.serve, name="RecognitionService", daemon=True)
+        self.thread.start()
+
+    def submit(self, img):
+        """
+        描述：提交一张文字行图片
+        参数：
+            img: 文字行图片 np.ndarray
+        返回值：
+            future: Future, 结果为 (文本, 置信度)
+        """
+        future = Future()
+        self.requests.put((img, future))
+        return future
+
+    def recognize(self, imgs):
+        """
+        描述：提交多张文字行图片并等待全部识别完成
+        参数：
+            imgs: List[np.ndarray]
+        返回值：
+            results: List[(文本, 置信度)] 与imgs顺序一致
+        """
+        futures = [self.submit(img) for img in imgs]
+        return [future.result() for future in futures]
+
+    def get_batch(self):
+        """
+        描述：阻塞等待第一个请求, 然后在 max_wait_ms 内尽量凑满一个批次
+        返回值：
+            batch: List[(图片, Future)]
+        """
+        batch = [self.requests.get()]
+        deadline = time.monotonic() + self.max_wait_ms / 1000
+        while len(batch) < self.max_batch_size:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(self.requests.get(timeout=timeout))
+            except queue.Empty:
+                break
+        return batch
+
+    def serve(self):
+        """
+        描述：后台线程, 循环取出批次进行识别, 把结果写入对应的Future
+        """
+        while True:
+            batch = self.get_batch()
+            imgs = [img for img, _ in batch]
+            try:
+                with self.lock:
+                    rec_res, _ = self.text_recognizer(imgs)
+            except Exception as e:
+                my_logger.error(f"文字识别批次失败: {str(e)}")
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+            self.batch_count += 1
+            self.image_count += len(batch)
+            for (_, future), res in zip(batch, rec_res):
+                future.set_result(res)
+
+    def get_stats(self):
+        """
+        描述：获取批处理统计信息
+        返回值：
+            stats: {"batch_count": 批次数, "image_count": 图片数, "mean_batch_size": 平均批大小}
+        """
+        mean_batch_size = self.image_count / self.batch_count if self.batch_count else 0
+        return {"batch_count": self.batch_count, "image_count": self.image_count, "mean_batch_size": mean_batch_size}
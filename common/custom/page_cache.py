@@ -0,0 +1,126 @@
+'''
+PageCache类
+把PdfProcessor每一页的处理结果page_info缓存到本地SQLite中
+同一份PDF再次分析时不需要重新OCR
+'''
+import os
+import json
+import time
+import sqlite3
+from contextlib import contextmanager
+
+
+class PageCache():
+    '''
+    描述：
+        页面缓存, 以 PDF内容哈希 + 页码 + 缩放比例 + OCR版本 为键, 保存 page_info
+        缓存总大小超过 max_size 时, 按最近最少使用(LRU)删除
+        总大小保存在只有一行的 meta 表中, 与页面在同一个事务中更新, 写入时不需要统计整张表
+    参数：
+        cache_path: SQLite文件路径
+        max_size: 缓存的最大字节数
+    '''
+    def __init__(self, cache_path, max_size=1024*1024*1024) -> None:
+        self.cache_path = cache_path # SQLite文件路径
+        self.max_size = max_size # 缓存的最大字节数
+        cache_dir = os.path.dirname(cache_path)
+        if cache_dir and not os.path.exists(cache_dir):
+            os.makedirs(cache_dir)
+        with self.connect() as connection:
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS pages ("
+                "key TEXT PRIMARY KEY, pdf_hash TEXT, pno INTEGER, "
+                "value TEXT, size INTEGER, last_access REAL)"
+            )
+            connection.execute("CREATE INDEX IF NOT EXISTS idx_last_access ON pages (last_access)")
+            connection.execute("CREATE TABLE IF NOT EXISTS meta (id INTEGER PRIMARY KEY CHECK (id = 0), total_size INTEGER)")
+            # 旧版本的缓存文件没有 meta 表, 统计一次已有页面的大小
+            connection.execute("INSERT OR IGNORE INTO meta (id, total_size) SELECT 0, COALESCE(SUM(size), 0) FROM pages")
+
+    @contextmanager
+    def connect(self):
+        """
+        描述：
+            每次操作打开一个新的连接, 多线程、多进程都可以安全使用
+            正常结束时提交事务, 出错时回滚, 最后关闭连接
+        """
+        connection = sqlite3.connect(self.cache_path, timeout=30)
+        try:
+            with connection:
+                yield connection
+        finally:
+            connection.close()
+
+    def get_key(self, pdf_hash, pno, zoom, version):
+        """
+        描述：生成缓存的键
+        参数：
+            pdf_hash: PDF内容哈希
+            pno: 页码
+            zoom: 渲染缩放比例
+            version: OCR模型版本及处理参数
+        返回值：
+            key: str
+        """
+        return f"{pdf_hash}:{pno}:{zoom}:{version}"
+
+    def get(self, key):
+        """
+        描述：读取缓存, 并更新最近使用时间
+        参数：
+            key: 缓存的键
+        返回值：
+            page_info: 页面信息, 没有缓存时返回None
+        """
+        with self.connect() as connection:
+            row = connection.execute("SELECT value FROM pages WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            connection.execute("UPDATE pages SET last_access = ? WHERE key = ?", (time.time(), key))
+        return json.loads(row[0])
+
+    def set(self, key, pdf_hash, pno, page_info):
+        """
+        描述：写入缓存, 超过最大字节数时删除最久未使用的页面
+        参数：
+            key: 缓存的键
+            pdf_hash: PDF内容哈希
+            pno: 页码
+            page_info: 页面信息
+        """
+        value = json.dumps(page_info, ensure_ascii=False)
+        size = len(value.encode("utf-8"))
+        with self.connect() as connection:
+            # 先更新总大小, 开始写事务后再读取被替换的页面大小, 多个进程同时写入时总大小也是准确的
+            connection.execute(
+                "UPDATE meta SET total_size = total_size + ? - COALESCE((SELECT size FROM pages WHERE key = ?), 0) WHERE id = 0",
+                (size, key)
+            )
+            connection.execute(
+                "INSERT OR REPLACE INTO pages (key, pdf_hash, pno, value, size, last_access) VALUES (?, ?, ?, ?, ?, ?)",
+                (key, pdf_hash, pno, value, size, time.time())
+            )
+            self.evict(connection)
+
+    def evict(self, connection):
+        """
+        描述：
+            缓存总大小超过 max_size 时, 按最近使用时间从旧到新删除
+            按顺序逐行读取, 释放足够的空间后停止, 不读取整张表
+        参数：
+            connection: SQLite连接, 已经开始写事务
+        """
+        total_size = connection.execute("SELECT total_size FROM meta WHERE id = 0").fetchone()[0]
+        if total_size <= self.max_size:
+            return
+        keys = [] # 需要删除的页面
+        freed = 0 # 删除后释放的字节数
+        cursor = connection.execute("SELECT key, size FROM pages ORDER BY last_access")
+        for key, size in cursor:
+            if total_size - freed <= self.max_size:
+                break
+            keys.append((key,))
+            freed += size
+        cursor.close()
+        connection.executemany("DELETE FROM pages WHERE key = ?", keys)
+        connection.execute("UPDATE meta SET total_size = total_size - ? WHERE id = 0", (freed,))
@@ -5,13 +5,16 @@ AnalysisPDF类
 import os
 import re
 import sys
+import time
 import jieba
 import datetime
 import numpy as np
 
 from django.conf import settings
 from common.base.base_respons import retJson
-from common.custom.pdf_processor import PdfProcessor, clean_content
+from common.custom.pdf_processor import clean_content
+from common.custom.pdf_jobs import TOPIC_KEYWORDS, create_pdf_processor, wait_pdf_job, record_processing_time
+from common.custom.document import Document
 from common.custom.excel_processor import write_indicators_to_excel1
 from common.custom.excel_processor import write_indicators_to_excel2
 from common.custom.excel_processor import read_ESG_from_excel
@@ -24,6 +27,8 @@ from common.custom.keywords_processor import get_paragraphs_with_keywords_precis
 from common.custom.keywords_processor import get_sentences_with_keywords
 from common.custom.keywords_processor import get_management_speech_paragraphs
 from common.custom.utils import remove_duplicate, check_pno
+from common.custom.tokenizer import get_tokenizer
+from common.custom.logger import my_logger
 
 class PdfAnalyst():
     '''
@@ -55,14 +60,33 @@ class PdfAnalyst():
         check_pno(self.pno_start, self.pno_end) # 判断页码是否合法
 
         self.date = datetime.datetime.now().strftime('%Y%m%d')
+        self.tokenizer = get_tokenizer(settings.JIEBA_CACHE_SIZE, settings.JIEBA_CACHE_PATH or None) # 分词缓存, 所有请求共用
 
-        self.pdf = PdfProcessor(self.filepath, media_root=settings.MEDIA_ROOT) # 提取PDF内容存储到self.pdf.document_info
-        self.pdf.run()
-        self.keywords_normal = ["碳", "绿色", "环保"]
-
-        # 读取ESG数据
+        wait_pdf_job(self.filepath) # 上传时已经开始后台识别, 等待其完成后直接读取页面缓存
+        self.pdf = create_pdf_processor(self.filepath, self.get_topic_keywords()) # 提取PDF内容存储到self.pdf.document_info
         filepath_ESG_data = os.path.join(settings.BASE_DIR, "data", "数据-股权融资优势和ESG评级.xls")
-        self.ESG_data = read_ESG_from_excel(filepath_ESG_data)
+        start_time = time.time()
+        if settings.PDF_PROCESSING_NUMBER > 1:
+            self.pdf.run_multiprocessing()
+            elapsed = time.time() - start_time
+            self.ESG_data = read_ESG_from_excel(filepath_ESG_data) # 读取ESG数据
+        else:
+            self.pdf.document_info = []
+            overhead = 0.0 # 与页面处理无关的耗时, 不计入处理时间
+            for page_info in self.pdf.iter_document_info():
+                self.pdf.document_info.append(page_info)
+                if len(self.pdf.document_info) == 1:
+                    # 后续页面在后台继续识别, 同时加载jieba词典和ESG数据
+                    overhead_start = time.time()
+                    jieba.initialize()
+                    self.ESG_data = read_ESG_from_excel(filepath_ESG_data) # 读取ESG数据
+                    overhead = time.time() - overhead_start
+            elapsed = time.time() - start_time - overhead
+            if len(self.pdf.document_info) == 0:
+                self.ESG_data = read_ESG_from_excel(filepath_ESG_data) # 读取ESG数据
+        record_processing_time(self.pdf, elapsed) # 校准处理时间的估计
+        self.pdf.document_info = Document.from_dicts(self.pdf.document_info) # 转换为紧凑的文档结构
+        self.keywords_normal = ["碳", "绿色", "环保"]
 
         # 读取碳中和专业词
         filepath_professional_words = os.path.join(settings.BASE_DIR, "data", "所需表.xls")
@@ -104,6 +128,9 @@ class PdfAnalyst():
         # 记录句子出现的次数
         self.sentence_count_dict = {}
 
+        # 按关键词筛选的段落, 每个三级指标使用相同的关键词, 只筛选一次 {(文档, 关键词, 句子数): List[(pno, paragraph)]}
+        self.paragraphs_cache = {}
+
         # 获取公司股票代码、名字、年份
         self.company_code, self.company_name, self.year = self.get_company_code_name_year()
         self.result["company_code"] = self.company_code
@@ -129,8 +156,7 @@ class PdfAnalyst():
 
                     if self.systemId == 1:
                         # 筛选含有碳、环保、绿色的相关段落
-                        self.relevant_pno_paragraphs = get_paragraphs_with_keywords_precisely(
-                            self.pdf.document_info, self.keywords_normal, sentence_number=5)
+                        self.relevant_pno_paragraphs = self.get_topic_paragraphs(self.keywords_normal, sentence_number=5)
                         # 根据关键词进行分析
                         content, image_count, table_count, sentences_count = self.analysis_with_keywords_system1(indicator_level_3_name, keywords_1, keywords_2, keywords_3)
                         indicator_level_3["文字内容"] = content
@@ -149,8 +175,7 @@ class PdfAnalyst():
                         else:
                             indicator_level_3_method = "关键词"
                         # 筛选含有绿色 碳 温室气体 环保 能源的相关段落
-                        self.relevant_pno_paragraphs = get_paragraphs_with_keywords_precisely(
-                            self.pdf.document_info, ["绿色", "碳", "温室气体", "环保", "能源"], sentence_number=5)
+                        self.relevant_pno_paragraphs = self.get_topic_paragraphs(["绿色", "碳", "温室气体", "环保", "能源"], sentence_number=5)
                         # 根据关键词进行分析
                         content, score = self.analysis_with_keywords_system2(
                             indicator_level_3_name, indicator_level_3_method, keywords_1, keywords_2, keywords_3)
@@ -167,6 +192,46 @@ class PdfAnalyst():
         relative_path = os.path.relpath(self.execl_filepath, settings.BASE_DIR)
         self.result["filepath"] = os.path.join(os.path.sep, relative_path)
 
+        # 分词缓存的命中率, 保存缓存供之后的请求使用
+        stats = self.tokenizer.get_stats()
+        my_logger.info(f"分词缓存: 命中 {stats['hits']} 次, 未命中 {stats['misses']} 次, 命中率 {stats['hit_rate']:.1%}, 缓存 {stats['size']} 句")
+        try:
+            self.tokenizer.save()
+        except Exception as e:
+            my_logger.warning(f"保存分词缓存失败: {str(e)}")
+
+    def get_topic_paragraphs(self, keywords, sentence_number=5):
+        '''
+        描述：
+            获取含有关键词的段落, 见 get_paragraphs_with_keywords_precisely
+            按文档、关键词和句子数缓存, 所有三级指标和系统2的特殊指标共用筛选结果
+        参数：
+            keywords: list 关键词
+            sentence_number: int 段落的句子数
+        返回值：
+            pno_paragraphs: List[(pno, paragraph)] 缓存结果的副本
+        '''
+        key = (id(self.pdf.document_info), tuple(keywords), sentence_number)
+        if key not in self.paragraphs_cache:
+            self.paragraphs_cache[key] = get_paragraphs_with_keywords_precisely(self.pdf.document_info, list(keywords), sentence_number=sentence_number)
+        return list(self.paragraphs_cache[key])
+
+    def get_topic_keywords(self):
+        '''
+        描述：
+            获取主题词, 包括筛选段落使用的固定关键词和所有三级指标的关键词
+            只有包含这些词的页面才会对分析结果产生影响
+        返回值：
+            topic_keywords: list 主题词
+        '''
+        topic_keywords = set(TOPIC_KEYWORDS)
+        for indicator_level_1 in self.indicators:
+            for indicator_level_2 in indicator_level_1["二级指标"]:
+                for indicator_level_3 in indicator_level_2["三级指标"]:
+                    keywords_1, keywords_2, keywords_3 = split_keywords(indicator_level_3["keywords"])
+                    topic_keywords.update(keywords_1 + keywords_2 + keywords_3)
+        return sorted([word for word in topic_keywords if word.strip()])
+
     def get_company_code_name_year(self):
         '''
         描述：获取公司股票代码、公司名字、年份
@@ -302,8 +367,7 @@ class PdfAnalyst():
 
         elif name == "是否将此类气候变化流程纳入企业的整体风险管理系统或流程":
             # 获取“风险”段落
-            pno_paragraphs = get_paragraphs_with_keywords_precisely(
-                self.pdf.document_info, ["风险"], sentence_number=5)
+            pno_paragraphs = self.get_topic_paragraphs(["风险"], sentence_number=5)
             # 段落中含有管理机制、制度、流程、整体、气候变化、能源的句子
             pno_sentences = get_sentences_with_keywords(pno_paragraphs, ["管理机制", "制度", "流程", "整体", "气候变化", "能源"], keywords_2=[], keywords_type="single")
             # sentences = self.get_nonrepeated_sentences(pno_sentences) # 去除与之前指标相重复的句子
@@ -314,8 +378,7 @@ class PdfAnalyst():
 
         elif name == "利益相关者沟通中识别了与双碳目标或低碳有关的利益相关者及其期望":
             # 获取“利益相关者”段落
-            pno_paragraphs = get_paragraphs_with_keywords_precisely(
-                self.pdf.document_info, ["利益相关者"], sentence_number=5)
+            pno_paragraphs = self.get_topic_paragraphs(["利益相关者"], sentence_number=5)
             # 段落中含有碳、气候变化、节能、能源的句子
             pno_sentences = get_sentences_with_keywords(pno_paragraphs, ["碳", "气候变化", "节能", "能源"], keywords_2=[], keywords_type="single")
             # sentences = self.get_nonrepeated_sentences(pno_sentences) # 去除与之前指标相重复的句子
@@ -326,8 +389,7 @@ class PdfAnalyst():
 
         elif name == "采取一致的方法学对长期的碳排放情况进行比较":
             # 获取“碳排放”段落
-            pno_paragraphs = get_paragraphs_with_keywords_precisely(
-                self.pdf.document_info, ["碳排放"], sentence_number=5)
+            pno_paragraphs = self.get_topic_paragraphs(["碳排放"], sentence_number=5)
             # 获取去年和前年的年份
             last_year, last_last_year = str(self.year - 1), str(self.year - 2)
             # 段落中含有去年和前年的句子
@@ -492,7 +554,7 @@ class PdfAnalyst():
         返回值：
             count: int 常用词数量
         '''
-        words = jieba.lcut(content) 
+        words = set(self.tokenizer.cut_lines(content)) # content 是换行符拼接的句子, 每个句子的分词结果已经缓存
         count = 0
         for word in self.common_words: #直接遍历一遍即可
             if word in words:
@@ -509,7 +571,7 @@ class PdfAnalyst():
         返回值：
             count: int 专业词数量
         '''
-        words = jieba.lcut(content)
+        words = set(self.tokenizer.cut_lines(content))
         count = 0
         for word in self.professional_words:
             if word in words:
@@ -0,0 +1,243 @@
+'''
+PdfJob类
+上传PDF后在后台线程中提前识别, 识别结果写入页面缓存
+calculate 时等待或复用后台识别的结果, 利用用户填写页码等参数的时间进行OCR
+'''
+import time
+import uuid
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from common.custom.logger import my_logger
+from common.custom.page_cache import PageCache
+from common.custom.pdf_processor import PdfProcessor
+from common.custom.time_estimator import get_time_estimator
+
+# 筛选段落使用的固定主题词, 上传时还没有指标, 后台识别只使用这些词
+TOPIC_KEYWORDS = ["碳", "绿色", "环保", "温室气体", "能源", "风险", "利益相关者", "气候", "节能"]
+
+# 进程内的后台识别任务
+pdf_jobs = {} # {job_id: PdfJob}
+pdf_jobs_lock = threading.Lock()
+pdf_jobs_executor = None # 后台识别线程池, 第一次提交任务时创建
+
+
+def create_pdf_processor(filepath, topic_keywords=None):
+    """
+    描述：
+        按 settings 创建PdfProcessor, 后台识别和 PdfAnalyst 使用相同的参数, 页面缓存的键才能一致
+    参数：
+        filepath: PDF文件路径
+        topic_keywords: 初筛的主题词, None表示使用 TOPIC_KEYWORDS
+    返回值：
+        pdf: PdfProcessor
+    """
+    page_cache = PageCache(settings.PAGE_CACHE_PATH, max_size=settings.PAGE_CACHE_MAX_SIZE) # 页面缓存
+    pdf = PdfProcessor(filepath, media_root=settings.MEDIA_ROOT, processing_number=settings.PDF_PROCESSING_NUMBER, page_cache=page_cache)
+    pdf.adaptive_zoom = settings.PDF_ADAPTIVE_ZOOM # 自适应分辨率
+    pdf.batch_recognition = settings.PDF_BATCH_RECOGNITION # 批量识别
+    pdf.lazy_layout = settings.PDF_LAZY_LAYOUT # 延迟版面分析
+    pdf.vector_counting = settings.PDF_VECTOR_COUNTING # 根据PDF中的对象统计图表数量
+    pdf.layout_keywords = ["碳", "绿色", "环保"] # 与 PdfAnalyst.keywords_normal 一致, 统计图表数量时只会访问包含这些词的页面
+    pdf.cascade_ocr = settings.PDF_CASCADE_OCR # 低分辨率初筛
+    pdf.triage_zoom = settings.PDF_TRIAGE_ZOOM # 初筛的缩放比例
+    pdf.topic_keywords = TOPIC_KEYWORDS if topic_keywords is None else topic_keywords # 初筛命中这些词的页面以正常分辨率识别
+    return pdf
+
+
+def estimate_processing_time(pdf):
+    """
+    描述：根据校准数据估计PDF的处理时间
+    参数：
+        pdf: PdfProcessor, 由 create_pdf_processor 创建
+    返回值：
+        seconds: float 预计耗时(秒)
+    """
+    return get_time_estimator(settings.PDF_TIME_ESTIMATOR_PATH).estimate(pdf.get_page_categories())
+
+
+def record_processing_time(pdf, elapsed):
+    """
+    描述：用PDF处理的实际耗时校准处理时间的估计
+    参数：
+        pdf: 已经处理完成的PdfProcessor
+        elapsed: 实际耗时(秒)
+    """
+    get_time_estimator(settings.PDF_TIME_ESTIMATOR_PATH).record(pdf.page_timings, elapsed)
+
+
+class PdfJob():
+    '''
+    描述：
+        一个PDF的后台识别任务, 逐页识别并写入页面缓存
+        status: queued(排队中)、running(识别中)、done(完成)、failed(失败)、cancelled(已取消)
+    参数：
+        filepath: PDF文件路径
+        page_count: 页数
+        estimated_time: 预计识别耗时(秒), 见 estimate_processing_time
+    '''
+    def __init__(self, filepath, page_count, estimated_time=0.0) -> None:
+        self.job_id = uuid.uuid4().hex # 任务ID
+        self.filepath = filepath
+        self.page_count = page_count
+        self.processed_pages = 0 # 已经识别的页数
+        self.estimated_time = estimated_time # 预计识别耗时(秒)
+        self.status = "queued"
+        self.error = None # 失败原因
+        self.created_time = time.time()
+        self.start_time = None
+        self.end_time = None # 任务结束(完成、失败、取消)的时间
+        self.future = None # 线程池返回的Future
+
+    def run(self):
+        """
+        描述：在后台线程中识别PDF, 每一页的结果由 PdfProcessor 写入页面缓存
+        """
+        self.status = "running"
+        self.start_time = time.time()
+        try:
+            pdf = create_pdf_processor(self.filepath)
+            if settings.PDF_PROCESSING_NUMBER > 1:
+                pdf.run_multiprocessing()
+                self.processed_pages = len(pdf.document_info)
+            else:
+                for _ in pdf.iter_document_info():
+                    self.processed_pages += 1
+            record_processing_time(pdf, time.time() - self.start_time)
+            self.status = "done"
+            my_logger.info(f"后台识别 {self.filepath} 完成, 耗时 {time.time() - self.start_time:.1f} 秒")
+        except Exception as e:
+            self.status = "failed"
+            self.error = str(e)
+            my_logger.error(f"后台识别 {self.filepath} 失败: {str(e)}")
+        finally:
+            self.end_time = time.time()
+
+    def cancel(self):
+        """
+        描述：取消还没有开始的任务
+        返回值：
+            True: 已取消
+        """
+        if self.future is not None and self.future.cancel():
+            self.status = "cancelled"
+            self.end_time = time.time()
+        return self.status == "cancelled"
+
+    def wait(self):
+        """
+        描述：等待任务结束, 失败时不抛出异常, 调用方重新识别即可
+        """
+        if self.future is not None and not self.future.cancelled():
+            self.future.result()
+
+    def get_remaining_time(self):
+        """
+        描述：估计任务本身剩余的识别时间(秒), 按已识别的页数比例扣除
+        """
+        if self.status != "queued" and self.status != "running":
+            return 0.0
+        return self.estimated_time * (1 - self.processed_pages / max(1, self.page_count))
+
+    def to_dict(self):
+        """
+        描述：任务状态, 用于接口返回
+            predicted_seconds: 预计还需要的秒数, 包括排在前面的任务
+            predicted_time: 同上, 单位为分钟, 与 upload_pdfs 的 predicted_time 一致
+        """
+        predicted_seconds = get_wait_time(self) + self.get_remaining_time()
+        return {
+            "job_id": self.job_id,
+            "filepath": self.filepath,
+            "status": self.status,
+            "page_count": self.page_count,
+            "processed_pages": self.processed_pages,
+            "error": self.error,
+            "predicted_seconds": round(predicted_seconds, 1),
+            "predicted_time": int(predicted_seconds / 60),
+        }
+
+
+def submit_pdf_job(filepath, page_count):
+    """
+    描述：提交PDF的后台识别任务
+    参数：
+        filepath: PDF文件路径
+        page_count: 页数
+    返回值：
+        job: PdfJob
+    """
+    global pdf_jobs_executor
+    pdf = create_pdf_processor(filepath)
+    job = PdfJob(filepath, page_count, estimate_processing_time(pdf))
+    pdf.close_pdfplumber()
+    with pdf_jobs_lock:
+        remove_expired_jobs()
+        if pdf_jobs_executor is None:
+            pdf_jobs_executor = ThreadPoolExecutor(max_workers=settings.PDF_BACKGROUND_WORKERS, thread_name_prefix="PdfJob")
+        pdf_jobs[job.job_id] = job
+        job.future = pdf_jobs_executor.submit(job.run)
+    return job
+
+
+def remove_expired_jobs():
+    """
+    描述：删除结束超过 PDF_JOB_TTL 秒的任务, 调用方需要持有 pdf_jobs_lock
+    """
+    now = time.time()
+    for job_id in [job_id for job_id, job in pdf_jobs.items() if job.end_time is not None and now - job.end_time > settings.PDF_JOB_TTL]:
+        del pdf_jobs[job_id]
+
+
+def get_wait_time(job):
+    """
+    描述：估计任务开始前还需要等待的时间(秒), 排在前面的任务剩余时间之和除以并行的任务数
+    参数：
+        job: PdfJob
+    返回值：
+        seconds: float
+    """
+    if job.status != "queued":
+        return 0.0
+    with pdf_jobs_lock:
+        ahead = [other for other in pdf_jobs.values() if other.created_time < job.created_time and other.status in ["queued", "running"]]
+    return sum([other.get_remaining_time() for other in ahead]) / settings.PDF_BACKGROUND_WORKERS
+
+
+def get_pdf_job(job_id=None, filepath=None):
+    """
+    描述：
+        按任务ID或PDF文件路径获取后台识别任务, 同一个文件有多个任务时返回最新的
+        结束超过 PDF_JOB_TTL 秒的任务已经删除
+    参数：
+        job_id: 任务ID
+        filepath: PDF文件路径
+    返回值：
+        job: PdfJob, 不存在时返回None
+    """
+    with pdf_jobs_lock:
+        remove_expired_jobs()
+        if job_id is not None:
+            return pdf_jobs.get(job_id)
+        jobs = [job for job in pdf_jobs.values() if job.filepath == filepath]
+    return max(jobs, key=lambda job: job.created_time) if len(jobs) else None
+
+
+def wait_pdf_job(filepath):
+    """
+    描述：
+        calculate 开始识别之前调用
+        后台任务正在识别时等待其完成, 之后直接读取页面缓存; 还在排队时取消, 由调用方立即识别
+    参数：
+        filepath: PDF文件路径
+    返回值：
+        job: PdfJob, 没有后台任务时返回None
+    """
+    job = get_pdf_job(filepath=filepath)
+    if job is None or job.cancel():
+        return job
+    if job.status != "done":
+        my_logger.info(f"等待后台识别 {filepath}, 已识别 {job.processed_pages}/{job.page_count} 页")
+    job.wait()
+    return job
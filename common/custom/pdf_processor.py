@@ -4,170 +4,1253 @@ PdfProcessor类
 '''
 import os
 import re
-import fitz
+import json
 import time
+import fitz
+import queue
 import random
 import string
 import datetime
+import threading
 import pdfplumber
+import multiprocessing
 import numpy as np
-from common.custom.ocr import MyOCR
-from multiprocessing import Pool
-from pathos.multiprocessing import Pool as PathosPool
+from collections import Counter
+from common.custom.logger import my_logger
+from common.custom.ocr import get_ocr_engine, OCR_VERSION
+from common.custom.utils import pixmap_to_array, get_containment_matrix, is_single_column_points, get_column_ids, get_file_hash
+from common.custom.utils import sort_structure, get_rect_clusters
 
 
 class PdfProcessor():
     '''
     描述：
         PdfProcessor类，利用PaddleOCR用于提取PDF文件中的文本、图像、表格
+        有可用文本层的页面直接从PDF中提取文本, 只有扫描页、图片页才进行OCR
     参数：
         filepath: PDF文件路径
         media_root: 保存图片的路径
+        processing_number: 多进程处理时的进程数, 默认为CPU核数
+        cpu_threads: 每个OCR引擎使用的CPU线程数, 默认为PaddleOCR的默认值
+        page_cache: PageCache 页面缓存, None表示不使用缓存
     成员变量：
         document_info: list(page_info)
         page_info: {
             "pno": 页码,
-            "type": 页面类型,
-            "content": 页面内容
+            "content": 页面内容,
+            "image_count": 图片数量,
+            "table_count": 表格数量,
+            "new_structure": 每一个文字块及其下方的图片数量和表格数量,
+            "page_type": 页面类型 text(文本层)、ocr、blank(空白页)、photo(整页图片)、divider(章节分隔页),
+            "tier": 识别的分辨率层级 full(正常分辨率)、triage(低分辨率初筛)
         }
+        vector_counting 为 True 时, 有文本层的页面不进行版面分析,
+        文字块来自文本层, 表格来自pdfplumber, 图片来自PDF中的图片和矢量图形, 见 get_vector_structure
+        cascade_ocr 为 True 时, OCR页面先以 triage_zoom 进行低分辨率识别,
+        识别结果包含 topic_keywords 中的词时再以正常分辨率重新识别
+        classify_pages 为 True 时, 空白页、整页图片、章节分隔页不进行版面分析和文字识别
+        run 使用渲染、推理、后处理三个阶段的流水线, 阶段之间的队列长度为 pipeline_depth
+        strip_boilerplate 为 True 时, 多个页面顶部或底部重复出现的文字行(页眉、页脚、页码)不计入页面内容, 见 get_boilerplate
+        lazy_layout 为 True 时, 有文本层的页面先只提取文字,
+        image_count、table_count、new_structure 第一次访问时才进行版面分析, 见 LazyPageInfo
     '''
-    def __init__(self, filepath, media_root) -> None:
+    def __init__(self, filepath, media_root, processing_number=None, cpu_threads=None, page_cache=None) -> None:
         self.filepath = filepath # PDF文件路径
         self.documnet = fitz.open(filepath) # PyMuPdf打开PDF文件
         self.pdfplumber = pdfplumber.open(filepath) # pdfplumber打开PDF文件
         self.media_root = media_root # 保存图片的路径
-        self.pdf_ocr = MyOCR()
+        self.cpu_threads = cpu_threads # 每个OCR引擎使用的CPU线程数
+        self._pdf_ocr = None # OCR引擎, 第一次使用时才获取, 多进程处理时主进程不需要加载
+        self.page_cache = page_cache # 页面缓存
+        self._pdf_hash = None # PDF内容哈希, 用于缓存的键
         self.zoom_x = 2.0 # 缩放比例
         self.zoom_y = 2.0 # 缩放比例
         self.mat = fitz.Matrix(self.zoom_x, self.zoom_y) # 缩放矩阵
-        self.y_threshold = 300 # y轴阈值
-        self.x_threshold = 20 # x轴阈值
-        self.processing_number = 4 # 处理的进程数
+        self.grayscale = False # 是否渲染为灰度图
+        self.adaptive_zoom = False # 是否根据页面特征自适应选择缩放比例
+        self.target_text_height = 20 # 自适应分辨率: 文字渲染后的目标高度(像素)
+        self.min_zoom = 1.0 # 自适应分辨率: 最小缩放比例
+        self.max_zoom = 3.0 # 自适应分辨率: 最大缩放比例
+        self.max_image_side = 2400 # 自适应分辨率: 渲染后图片长边的最大像素
+        self.save_temp_images = False # 是否把渲染的页面图片保存到 temp_images 中, 仅用于调试
+        self.img_save_paths = [] # 调试时保存的图片路径
+        self.overlap_tolerance = 5 # 图表顶部与上方文字块底部允许重叠的像素
+        self.processing_number = processing_number or os.cpu_count() or 1 # 处理的进程数
+        self.use_text_layer = True # 有可用文本层的页面直接从PDF中提取文字, 不进行OCR
+        self.single_pass = True # 直接使用PPStructure版面内的识别结果, 不再进行一次整页OCR
+        self.batch_recognition = False # OCR页面只做版面分析和整页检测, 文字行交给批处理服务识别
+        self.text_layer_min_length = 20 # 文本层至少包含的字符数
+        self.text_layer_max_garbled = 0.05 # 文本层中乱码字符的最大占比
+        self.text_layer_max_image_coverage = 0.3 # 图片覆盖页面的最大比例, 超过时图片中可能有文字, 页面需要OCR
+        self.classify_pages = True # 空白页、整页图片、章节分隔页跳过OCR
+        self.classify_zoom = 0.2 # 页面分类时渲染缩略图的缩放比例
+        self.blank_max_std = 3 # 空白页: 缩略图灰度的最大标准差
+        self.photo_min_coverage = 0.85 # 整页图片: 图片覆盖页面的最小比例
+        self.photo_max_white = 0.5 # 整页图片: 缩略图中白色像素的最大比例, 用于区分扫描的文字页
+        self.divider_max_coverage = 0.5 # 章节分隔页: 图片覆盖页面的最大比例, 避免把扫描页当作分隔页
+        self.divider_max_ink = 0.01 # 章节分隔页: 缩略图中文本层文字以外的墨迹像素的最大比例, 避免跳过图片、矢量图形中的文字
+        self.inference_time = 0.0 # 推理总耗时, 用于估计跳过OCR节省的时间
+        self.inference_pages = 0 # 进行推理的页数
+        self.page_timings = [] # 每一页的类别和各阶段耗时之和 List[(类别, 秒)], 用于校准处理时间的估计, 见 get_timing_category
+        self.vector_counting = False # 有文本层的页面根据PDF中的对象统计图表数量, 不使用版面分析模型
+        self.figure_min_area = 0.01 # 图片、矢量图形占页面面积的最小比例, 更小的视为图标
+        self.figure_max_area = 0.6 # 矢量图形占页面面积的最大比例, 更大的视为背景或边框
+        self.figure_min_paths = 5 # 矢量图形至少包含的路径数
+        self.cascade_ocr = False # OCR页面先低分辨率初筛, 命中主题词的页面再以正常分辨率识别
+        self.triage_zoom = 1.0 # 初筛的缩放比例
+        self.topic_keywords = [] # 主题词, 初筛文字包含其中任意一个词的页面重新识别, 为空时所有页面都重新识别
+        self.detect_gutter = True # 双页在检测到的中缝处切分, 否则在页面正中间切分
+        self.gutter_search_ratio = 0.1 # 在页面中线左右各 10% 宽度的范围内寻找中缝
+        self.strip_boilerplate = True # 去除多个页面相同位置重复出现的页眉、页脚、页码
+        self.boilerplate_margin = 0.1 # 页眉、页脚: 页面顶部、底部各 10% 高度的范围
+        self.boilerplate_min_ratio = 0.3 # 页眉、页脚: 至少出现在 30% 有文本层的页面中
+        self.boilerplate_min_pages = 3 # 页眉、页脚: 至少出现在3个页面中
+        self.boilerplate = None # 文档的页眉页脚指纹 {(位置, 文字)}, 第一次使用时检测, 见 get_boilerplate
+        self.lazy_layout = False # 有文本层的页面延迟到第一次访问图表数量时才进行版面分析
+        self.layout_keywords = ["碳", "绿色", "环保"] # 延迟版面分析时, 页面内容包含其中任意一个词才进行版面分析
+        self.pipeline_depth = 4 # 流水线每个阶段之间最多缓存的页数, 限制渲染图片占用的内存
+        self.document_lock = threading.RLock() # PyMuPdf不是线程安全的, 同一时间只有一个线程访问PDF
+
+    @property
+    def pdf_ocr(self):
+        """
+        描述: OCR引擎, 第一次使用时从进程内共享的引擎中获取, 不会为每个PDF重新加载模型
+        """
+        if self._pdf_ocr is None:
+            if self.cpu_threads is None:
+                self._pdf_ocr = get_ocr_engine()
+            else:
+                self._pdf_ocr = get_ocr_engine(cpu_threads=self.cpu_threads)
+        return self._pdf_ocr
+
+    @property
+    def pdf_hash(self):
+        """
+        描述: PDF内容哈希, 第一次使用时计算
+        """
+        if self._pdf_hash is None:
+            self._pdf_hash = get_file_hash(self.filepath)
+        return self._pdf_hash
+
+    def get_options(self):
+        """
+        描述: 
+            影响页面处理结果的参数, 用于传递给子进程和生成缓存的键
+        返回值:
+            options: dict
+        """
+        return {
+            "zoom_x": self.zoom_x,
+            "zoom_y": self.zoom_y,
+            "grayscale": self.grayscale,
+            "adaptive_zoom": self.adaptive_zoom,
+            "target_text_height": self.target_text_height,
+            "min_zoom": self.min_zoom,
+            "max_zoom": self.max_zoom,
+            "max_image_side": self.max_image_side,
+            "use_text_layer": self.use_text_layer,
+            "text_layer_min_length": self.text_layer_min_length,
+            "text_layer_max_garbled": self.text_layer_max_garbled,
+            "text_layer_max_image_coverage": self.text_layer_max_image_coverage,
+            "single_pass": self.single_pass,
+            "batch_recognition": self.batch_recognition,
+            "lazy_layout": self.lazy_layout,
+            "classify_pages": self.classify_pages,
+            "classify_zoom": self.classify_zoom,
+            "blank_max_std": self.blank_max_std,
+            "photo_min_coverage": self.photo_min_coverage,
+            "photo_max_white": self.photo_max_white,
+            "divider_max_coverage": self.divider_max_coverage,
+            "divider_max_ink": self.divider_max_ink,
+            "detect_gutter": self.detect_gutter,
+            "gutter_search_ratio": self.gutter_search_ratio,
+            "vector_counting": self.vector_counting,
+            "figure_min_area": self.figure_min_area,
+            "figure_max_area": self.figure_max_area,
+            "figure_min_paths": self.figure_min_paths,
+            "cascade_ocr": self.cascade_ocr,
+            "triage_zoom": self.triage_zoom,
+            "topic_keywords": self.topic_keywords,
+            "strip_boilerplate": self.strip_boilerplate,
+            "boilerplate_margin": self.boilerplate_margin,
+            "boilerplate_min_ratio": self.boilerplate_min_ratio,
+            "boilerplate_min_pages": self.boilerplate_min_pages,
+            "boilerplate": sorted([list(item) for item in self.get_boilerplate()]),
+        }
+
+    def set_options(self, options):
+        """
+        描述: 设置页面处理参数, 与 get_options 对应
+        参数:
+            options: dict
+        """
+        for key, value in options.items():
+            setattr(self, key, value)
+        if self.boilerplate is not None:
+            self.boilerplate = set([tuple(item) for item in self.boilerplate]) # 主进程已经检测的页眉页脚指纹
+        self.mat = fitz.Matrix(self.zoom_x, self.zoom_y) # 缩放矩阵
+
+    def get_cache_key(self, pno, tier="full"):
+        """
+        描述: 
+            生成页面缓存的键
+            初筛结果和正常分辨率的结果分别缓存, 正常分辨率的结果与不使用 cascade_ocr 时共用
+        参数:
+            pno: 页码
+            tier: 识别的分辨率层级 full 或 triage
+        返回值:
+            key: str
+        """
+        options = self.get_options()
+        zoom = f"{options.pop('zoom_x')}x{options.pop('zoom_y')}"
+        # 页眉页脚指纹由PDF内容和检测参数决定, 不需要放入键中
+        for key in ["cascade_ocr", "triage_zoom", "topic_keywords", "boilerplate"]:
+            options.pop(key)
+        if tier == "triage":
+            zoom = f"{self.triage_zoom}x{self.triage_zoom}:triage"
+        version = f"{OCR_VERSION}:{json.dumps(options, sort_keys=True)}"
+        return self.page_cache.get_key(self.pdf_hash, pno, zoom, version)
 
     def run(self):
         """
         描述: PDF处理
         """
-        self.document_info = [] # PDF每一页的信息
-        self.img_save_paths = [] # 保存图片的路径
-        for pno, page in enumerate(self.documnet):
-            rect = page.rect
-            if rect.width / rect.height <= 1.4:
-                page_info = self.single_page(pno, page) # 单页
-            else:
-                page_info = self.double_page(pno, page) # 双页
+        self.document_info = list(self.iter_document_info()) # PDF每一页的信息
 
-            self.document_info.append(page_info) # 添加到文档信息中
-        
-        self.delete_images(self.img_save_paths) # 删除临时图片
-        self.pdfplumber.close() # 关闭pdfplumber
+    def iter_document_info(self):
+        """
+        描述: 
+            流水线处理PDF, 按页码顺序逐页返回页面信息
+            渲染线程: 读取缓存、提取文本层、渲染页面图片
+            推理线程: 版面分析和文字识别
+            调用方线程: 组装页面信息、写入缓存
+            阶段之间使用长度为 pipeline_depth 的队列, 同时存在的页面图片不超过队列长度
+            初筛命中主题词的页面由推理线程交回渲染线程, 优先以正常分辨率重新渲染, 完成的页面按页码顺序返回
+        返回值:
+            page_info 的生成器
+        """
+        render_queue = queue.Queue(maxsize=self.pipeline_depth) # 渲染完成, 等待推理的页面
+        result_queue = queue.Queue(maxsize=self.pipeline_depth) # 推理完成, 等待后处理的页面
+        feedback_queue = queue.Queue() # 推理线程每处理完一页通知渲染线程, 需要重新渲染时附带页码和初筛的耗时
+        stop_event = threading.Event() # 调用方提前结束时通知其他线程退出
+
+        def put(q, item):
+            # 队列满时等待, 调用方已经结束时放弃
+            while not stop_event.is_set():
+                try:
+                    q.put(item, timeout=0.1)
+                    return True
+                except queue.Full:
+                    continue
+            return False
+
+        def render():
+            outstanding = 0 # 已经交给推理线程、还没有处理完的页数
+            def handle_feedback(block):
+                # 处理推理线程的通知, 需要时以正常分辨率重新渲染; 调用方已经结束时返回False
+                nonlocal outstanding
+                while not stop_event.is_set():
+                    try:
+                        task = feedback_queue.get(timeout=0.1) if block else feedback_queue.get_nowait()
+                    except queue.Empty:
+                        if block:
+                            continue
+                        return True
+                    outstanding -= 1
+                    if task is not None:
+                        if not put(render_queue, self.prepare_full_page(task)):
+                            return False
+                        outstanding += 1
+                    if block:
+                        return True
+                return False
+
+            try:
+                for pno in range(self.documnet.page_count):
+                    if not handle_feedback(block=False):
+                        return
+                    if not put(render_queue, self.run_stage(self.prepare_page, pno)):
+                        return
+                    outstanding += 1
+                while outstanding > 0:
+                    if not handle_feedback(block=True):
+                        return
+            except Exception as e:
+                put(render_queue, e)
+                return
+            put(render_queue, None)
+
+        def infer():
+            while not stop_event.is_set():
+                try:
+                    task = render_queue.get(timeout=0.1)
+                except queue.Empty:
+                    continue
+                if task is None or isinstance(task, Exception):
+                    put(result_queue, task)
+                    return
+                try:
+                    task = self.run_stage(self.infer_page, task)
+                except Exception as e:
+                    put(result_queue, e)
+                    return
+                if task.get("needs_full"):
+                    feedback_queue.put({"pno": task["pno"], "elapsed": task["elapsed"]}) # 交回渲染线程重新渲染, 不保留初筛的图片
+                    continue
+                feedback_queue.put(None)
+                if not put(result_queue, task):
+                    return
+
+        document_info = [] # 已经处理的页面, 全部完成后记录页面类型
+        finished = {} # 已经完成、还没有返回的页面 {页码: page_info}, 重新渲染的页面会晚于后面的页面完成
+        threads = [threading.Thread(target=render, name="PdfRender", daemon=True),
+                   threading.Thread(target=infer, name="PdfInfer", daemon=True)]
+        for thread in threads:
+            thread.start()
+        try:
+            while True:
+                task = result_queue.get()
+                if task is None:
+                    break
+                if isinstance(task, Exception):
+                    raise task
+                finished[task["pno"]] = self.finish_page(task)
+                while len(document_info) in finished:
+                    page_info = finished.pop(len(document_info))
+                    document_info.append(page_info)
+                    yield page_info
+            self.log_page_types(document_info)
+        finally:
+            stop_event.set()
+            for thread in threads:
+                thread.join()
+            self.close_pdfplumber() # 关闭pdfplumber
 
     def run_multiprocessing(self):
         """
-        描述: 多进程PDF处理
-        # FIXME: 有bug，待修复
+        描述: 
+            多进程PDF处理
+            每个子进程启动时自己打开PDF并加载一次OCR模型, 之后只接收页码
+            结果按页码顺序保存到 self.document_info 中
         """
-        self.img_save_paths = [] # 保存图片的路径
-        self.mutil_process_res = [] # 进程池中的结果
-        processing_pool = PathosPool(self.processing_number) # 创建进程池
-        for pno, page in enumerate(self.documnet):
-            rect = page.rect
-            if rect.width / rect.height <= 1.4:
-                page_info = processing_pool.apply_async(self.single_page, args=(pno, page,))
-            else:
-                page_info = processing_pool.apply_async(self.double_page, args=(pno, page,))
-            self.mutil_process_res.append(page_info)
-            time.sleep(0.5)
-        
-        processing_pool.close() # 关闭进程池
-        processing_pool.join() # 等待进程池中的进程执行完毕
-        self.document_info = [res.get() for res in self.mutil_process_res] # 获取进程池中的结果
-        self.delete_images(self.img_save_paths) # 删除临时图片
-        self.pdfplumber.close() # 关闭pdfplumber
+        page_count = self.documnet.page_count
+        document_info = [None] * page_count
+        # 已经缓存的页面不需要交给子进程
+        if self.page_cache is not None:
+            for pno in range(page_count):
+                start_time = time.time()
+                document_info[pno] = self.page_cache.get(self.get_cache_key(pno))
+                if document_info[pno] is not None:
+                    self.page_timings.append(("cached", time.time() - start_time))
+        missing_pnos = [pno for pno in range(page_count) if document_info[pno] is None]
+
+        if len(missing_pnos):
+            processing_number = max(1, min(self.processing_number, len(missing_pnos))) # 进程数不超过页数
+            # 每个进程分到的CPU线程数, 避免多个进程的推理线程互相抢占CPU
+            cpu_threads = self.cpu_threads or max(1, (os.cpu_count() or 1) // processing_number)
+
+            # PaddlePaddle不支持fork, 使用spawn创建子进程
+            context = multiprocessing.get_context("spawn")
+            pdf_hash = self.pdf_hash if self.page_cache is not None else None
+            initargs = (self.filepath, self.media_root, cpu_threads, self.get_options(), self.page_cache, pdf_hash)
+            with context.Pool(processing_number, initializer=init_worker, initargs=initargs) as processing_pool:
+                for pno, (page_info, timing) in zip(missing_pnos, processing_pool.imap(process_page_in_worker, missing_pnos)):
+                    document_info[pno] = page_info
+                    self.page_timings.append(timing)
+
+        # 子进程和缓存返回的是普通dict, 延迟的版面分析由主进程完成
+        self.document_info = [self.attach_layout_loader(page_info) for page_info in document_info]
+        self.log_page_types(self.document_info)
+        self.close_pdfplumber() # 关闭pdfplumber
+
+    def process_page(self, pno):
+        '''
+        描述：
+            处理一页PDF, 有缓存时直接读取缓存
+        参数:
+            pno: 页码
+        返回值：
+            page_info: 页面信息
+        '''
+        return self.finish_page(self.infer_page_inline(self.run_stage(self.prepare_page, pno)))
 
-    def single_page(self, pno, page):
+    def extract_page(self, pno):
         '''
         描述：
-            单页PDF处理
+            提取一页PDF的信息, 不读取也不写入缓存
+        参数:
+            pno: 页码
+        返回值：
+            page_info: 页面信息
+        '''
+        task = self.run_stage(self.prepare_page, pno, use_cache=False)
+        return self.finish_page(self.infer_page_inline(task), use_cache=False)
+
+    def run_stage(self, stage, *args, **kwargs):
+        '''
+        描述：执行页面处理的一个阶段, 把耗时累加到 task["elapsed"] 中
+        参数:
+            stage: prepare_page 或 infer_page
+            args, kwargs: 阶段的参数
+        返回值：
+            task: 阶段的返回值
+        '''
+        start_time = time.time()
+        task = stage(*args, **kwargs)
+        task["elapsed"] = task.get("elapsed", 0.0) + time.time() - start_time
+        return task
+
+    def get_timing_category(self, task):
+        '''
+        描述：
+            页面耗时的类别, 用于按类别统计每一页的平均耗时
+            cached(读取缓存)、skipped(跳过OCR)、text:single、text:double、ocr:single、ocr:double
+        参数:
+            task: prepare_page 的返回值
+        返回值：
+            category: str
+        '''
+        if task["cached"]:
+            return "cached"
+        if task["page_type"] not in ["text", "ocr"]:
+            return "skipped"
+        return f"{task['page_type']}:{'double' if task['double'] else 'single'}"
+
+    def get_page_categories(self):
+        '''
+        描述：
+            不进行处理, 预测每一页的耗时类别, 用于估计处理时间
+            判断缓存、页面分类(与 prepare_page 相同)、文本层和单双页
+            classify_pages 为 True 时渲染 classify_zoom 的缩略图进行页面分类, 不渲染正常分辨率的页面
+        返回值：
+            categories: List[str] 每一页的类别, 同 get_timing_category
+        '''
+        categories = []
+        for pno in range(self.documnet.page_count):
+            if self.page_cache is not None and self.page_cache.get(self.get_cache_key(pno)) is not None:
+                categories.append("cached")
+                continue
+            with self.document_lock:
+                page = self.documnet[pno]
+                if self.classify_pages and self.classify_page(page) is not None:
+                    categories.append("skipped") # 空白页、整页图片、章节分隔页不进行OCR
+                    continue
+                task = {"cached": False, "page_type": "text" if self.has_text_layer(page) else "ocr", "double": len(self.get_page_clips(page)) > 1}
+            categories.append(self.get_timing_category(task))
+        return categories
+
+    def classify_page(self, page):
+        '''
+        描述：
+            根据缩略图的像素统计、图片覆盖比例和文本层字数, 判断页面是否不需要OCR
+            文本层字数达到 text_layer_min_length 的页面都需要处理
+            blank: 没有文字, 缩略图几乎是纯色
+            photo: 图片覆盖整个页面, 且缩略图中白色像素很少(扫描的文字页背景为白色)
+            divider: 只有少量文字, 没有图片和矢量图形, 缩略图中除了文本层的文字几乎没有墨迹
+        参数:
+            page: PyMuPdf的Page对象
+        返回值：
+            page_type: "blank"、"photo"、"divider", 需要OCR时返回None
+        '''
+        text = clean_content(page.get_text("text"))
+        if len(text) >= self.text_layer_min_length:
+            return None
+
+        coverage = self.get_image_coverage(page)
+        mat = fitz.Matrix(self.classify_zoom, self.classify_zoom)
+        pix = page.get_pixmap(matrix=mat, colorspace=fitz.csGRAY, alpha=False)
+        gray = np.frombuffer(pix.samples_mv, dtype=np.uint8).reshape(pix.height, pix.stride)[:, :pix.width]
+
+        if len(text) == 0 and gray.std() < self.blank_max_std:
+            return "blank"
+        if coverage >= self.photo_min_coverage and (gray > 230).mean() < self.photo_max_white:
+            return "photo"
+        if len(text) > 0 and coverage < self.divider_max_coverage and len(self.get_figure_rects(page, page.rect, [])) == 0:
+            if self.get_ink_ratio(page, gray) <= self.divider_max_ink:
+                return "divider"
+        return None
+
+    def get_ink_ratio(self, page, gray):
+        '''
+        描述：
+            缩略图中文本层文字区域以外的墨迹像素比例
+            与背景(灰度的中位数)相差超过40的像素视为墨迹, 彩色背景的分隔页也能识别
+        参数:
+            page: PyMuPdf的Page对象
+            gray: 页面的灰度缩略图 np.ndarray, 缩放比例为 classify_zoom
+        返回值：
+            ratio: float 0~1
+        '''
+        height, width = gray.shape
+        mask = np.zeros((height, width), dtype=bool) # 文本层文字所在的像素
+        for block in page.get_text("dict")["blocks"]:
+            if block["type"] != 0:
+                continue
+            for line in block["lines"]:
+                x0, y0, x1, y1 = line["bbox"]
+                x0, x1 = int((x0 - page.rect.x0) * self.classify_zoom) - 1, int(np.ceil((x1 - page.rect.x0) * self.classify_zoom)) + 1
+                y0, y1 = int((y0 - page.rect.y0) * self.classify_zoom) - 1, int(np.ceil((y1 - page.rect.y0) * self.classify_zoom)) + 1
+                mask[max(0, y0):max(0, y1), max(0, x0):max(0, x1)] = True
+        if mask.all():
+            return 0.0
+        ink = np.abs(gray.astype(np.int16) - int(np.median(gray))) > 40
+        return float(ink[~mask].mean())
+
+    def get_image_coverage(self, page):
+        '''
+        描述：计算页面中的图片覆盖页面的比例, 重叠的部分只计算一次
+        参数:
+            page: PyMuPdf的Page对象
+        返回值：
+            coverage: float 0~1
+        '''
+        rect = page.rect
+        grid = np.zeros((100, 100), dtype=bool) # 把页面划分为100x100的网格
+        for info in page.get_image_info():
+            bbox = fitz.Rect(info["bbox"]) & rect
+            if bbox.is_empty:
+                continue
+            x0, x1 = int((bbox.x0 - rect.x0) / rect.width * 100), int(np.ceil((bbox.x1 - rect.x0) / rect.width * 100))
+            y0, y1 = int((bbox.y0 - rect.y0) / rect.height * 100), int(np.ceil((bbox.y1 - rect.y0) / rect.height * 100))
+            grid[y0:y1, x0:x1] = True
+        return float(grid.mean())
+
+    def get_skipped_page_info(self, pno, page):
+        '''
+        描述：
+            不进行OCR的页面的页面信息, 文字来自文本层, 图片都归属于页面中唯一的文字块
+            图片数量包括PDF中的图片和矢量图形, 见 get_figure_rects
         参数:
             pno: 页码
             page: PyMuPdf的Page对象
         返回值：
             page_info: 页面信息
         '''
-        # 保存PDF页面图片
-        now = datetime.datetime.now().strftime('%Y%m%d%H%M%S')
-        suffix = ''.join(random.sample(string.ascii_letters + string.digits, 8))
-        img_save_path = os.path.join(self.media_root, 'temp_images', f"images_{pno}_{suffix}_{now}.png")
-        page.get_pixmap(matrix=self.mat).save(img_save_path)
-        self.img_save_paths.append(img_save_path)
+        content = self.get_text_layer_content(page) # 不包含页眉页脚
+        image_count = len(self.get_figure_rects(page, page.rect, []))
+        new_structure = [{"content": content, "image_count": image_count, "table_count": 0}] if content else []
+        return {"pno": pno, "content": content, "image_count": image_count, "table_count": 0, "new_structure": new_structure}
 
-        # 利用 PPStructure 和 paddleocr 进行版面分析和文字提取
-        structure = self.pdf_ocr.get_structure(img_save_path) # 速度比较慢
-        error_axis_x = 50 if self.is_single_colum(structure=structure) else 5 # 单栏双栏判断
+    def log_page_types(self, document_info):
+        '''
+        描述：记录每种类型的页数, 跳过OCR的页数和估计节省的时间, 以及每个分辨率层级的页数
+        参数:
+            document_info: List[page_info]
+        '''
+        page_types = Counter([page_info.get("page_type", "unknown") for page_info in document_info])
+        skipped = sum([page_types[page_type] for page_type in ["blank", "photo", "divider"]])
+        message = f"{os.path.basename(self.filepath)} 页面类型: {dict(page_types)}, 跳过OCR {skipped} 页"
+        if skipped and self.inference_pages:
+            message += f", 估计节省 {skipped * self.inference_time / self.inference_pages:.1f} 秒"
+        if self.cascade_ocr:
+            tiers = Counter([page_info.get("tier", "full") for page_info in document_info])
+            message += f", 分辨率层级: {dict(tiers)}"
+        my_logger.info(message)
 
-        page_info = {"pno": pno} # 页面信息
-        page_info["content"] = self.get_content_by_PaddleOCR(structure, img_save_path, error_axis_x) # 页面内容 by PaddleOCR [速度慢]
-        page_info["image_count"] = self.get_image_count(structure) # 图片数量
-        page_info["table_count"] = self.get_table_count(structure) # 表格数量
-        page_info["new_structure"] = self.get_image_table_count(structure) # 每一块下方的图片数量和表格数量
+    def get_boilerplate(self):
+        '''
+        描述：
+            获取文档的页眉页脚指纹, 第一次使用时读取缓存或检测, 之后每一页直接使用
+        返回值：
+            boilerplate: {(位置, 文字)}, 位置为 top 或 bottom, strip_boilerplate 为 False 时为空
+        '''
+        if not self.strip_boilerplate:
+            return set()
+        with self.document_lock:
+            if self.boilerplate is not None:
+                return self.boilerplate
+            params = [self.boilerplate_margin, self.boilerplate_min_ratio, self.boilerplate_min_pages]
+            key = None
+            if self.page_cache is not None:
+                key = self.page_cache.get_key(self.pdf_hash, -1, "", f"boilerplate:{json.dumps(params)}")
+                cached = self.page_cache.get(key)
+                if cached is not None:
+                    self.boilerplate = set([tuple(item) for item in cached["lines"]])
+                    return self.boilerplate
+            self.boilerplate = self.detect_boilerplate()
+            if key is not None:
+                self.page_cache.set(key, self.pdf_hash, -1, {"lines": sorted([list(item) for item in self.boilerplate])})
+            if len(self.boilerplate):
+                my_logger.info(f"{os.path.basename(self.filepath)} 页眉页脚: {sorted([text for _, text in self.boilerplate])}")
+            return self.boilerplate
 
-        return page_info
+    def detect_boilerplate(self):
+        '''
+        描述：
+            文档级检测页眉、页脚、页码
+            统计每一页文本层中顶部、底部 boilerplate_margin 范围内的文字行,
+            数字统一替换后(页码、年份不同也视为同一行), 在同一位置出现在足够多页面中的文字行视为页眉页脚
+            只读取文本层, 不需要渲染和推理
+        返回值：
+            boilerplate: {(位置, 文字)}
+        '''
+        counter = Counter() # {(位置, 文字): 出现的页数}
+        page_count = 0 # 有文本层文字的页数
+        for page in self.documnet:
+            rect = page.rect
+            keys = set()
+            has_text = False
+            for block in page.get_text("dict")["blocks"]:
+                if block["type"] != 0:
+                    continue
+                for line in block["lines"]:
+                    text = "".join([span["text"] for span in line["spans"]])
+                    if text.strip() == "":
+                        continue
+                    has_text = True
+                    position = self.get_margin_position(line["bbox"][1] - rect.y0, line["bbox"][3] - rect.y0, rect.height)
+                    fingerprint = get_line_fingerprint(text)
+                    if position is not None and fingerprint:
+                        keys.add((position, fingerprint))
+            page_count += has_text
+            counter.update(keys)
+        min_count = max(self.boilerplate_min_pages, page_count * self.boilerplate_min_ratio)
+        return set([key for key, count in counter.items() if count >= min_count])
 
-    def double_page(self, pno, page):
+    def get_margin_position(self, y0, y1, height):
+        '''
+        描述：判断文字行是否在页面顶部或底部 boilerplate_margin 范围内
+        参数:
+            y0, y1: 文字行上下边缘相对于页面顶部的坐标(磅)
+            height: 页面高度(磅)
+        返回值：
+            position: "top"、"bottom", 都不在时返回None
+        '''
+        if y1 <= height * self.boilerplate_margin:
+            return "top"
+        if y0 >= height * (1 - self.boilerplate_margin):
+            return "bottom"
+        return None
+
+    def is_boilerplate_line(self, text, y0, y1, height):
+        '''
+        描述：判断文字行是否为文档的页眉页脚
+        参数:
+            text: 文字行
+            y0, y1: 文字行上下边缘相对于页面顶部的坐标(磅)
+            height: 页面高度(磅)
+        返回值：
+            True: 页眉页脚, 不计入页面内容
+        '''
+        boilerplate = self.get_boilerplate()
+        if not boilerplate:
+            return False
+        position = self.get_margin_position(y0, y1, height)
+        return position is not None and (position, get_line_fingerprint(text)) in boilerplate
+
+    def attach_layout_loader(self, page_info):
         '''
         描述：
-            双页PDF处理
+            缺少版面分析结果的页面信息, 包装为 LazyPageInfo, 访问时由当前进程进行版面分析
+        参数:
+            page_info: 页面信息
+        返回值：
+            page_info: 页面信息
+        '''
+        if "new_structure" in page_info:
+            return page_info
+        return LazyPageInfo(page_info, self.load_layout)
+
+    def load_layout(self, page_info):
+        '''
+        描述：
+            对延迟的页面进行版面分析, 计算图片数量、表格数量和每一块下方的图表数量
+            页面内容不包含 layout_keywords 中的词时不进行版面分析, 这些页面的图表数量不会被使用
+            计算结果合并到页面缓存中已有的页面信息, 之后不需要重复计算
+        参数:
+            page_info: 页面信息, 至少包含 pno 和 content
+        返回值：
+            layout_info: {"image_count", "table_count", "new_structure"}
+        '''
+        layout_info = {"image_count": 0, "table_count": 0, "new_structure": []}
+        if not any([word in page_info["content"] for word in self.layout_keywords]):
+            return layout_info
+
+        pno = page_info["pno"]
+        if self.vector_counting:
+            with self.document_lock:
+                reopened = self.pdfplumber is None # 处理完成后pdfplumber已经关闭, get_plumber_page 会重新打开
+                try:
+                    layout_info = self.get_vector_page_info(pno, self.documnet[pno])
+                finally:
+                    if reopened:
+                        self.close_pdfplumber()
+            layout_info = {key: layout_info[key] for key in ["image_count", "table_count", "new_structure"]}
+            regions = []
+        else:
+            with self.document_lock:
+                page = self.documnet[pno]
+                regions = self.prepare_regions(pno, page, True)
+        for region in regions:
+            _, structure = self.finish_region(self.infer_region(region))
+            layout_info["image_count"] += self.get_image_count(structure)
+            layout_info["table_count"] += self.get_table_count(structure)
+            layout_info["new_structure"] += self.get_image_table_count(structure)
+
+        if self.page_cache is not None:
+            key = self.get_cache_key(pno)
+            cached = self.page_cache.get(key) or {} # 保留缓存中的 page_type、tier 等字段
+            self.page_cache.set(key, self.pdf_hash, pno, {**cached, **dict(page_info), **layout_info})
+        return layout_info
+
+    def get_vector_page_info(self, pno, page):
+        '''
+        描述：根据PDF中的对象得到有文本层页面的页面信息, 字段同版面分析得到的页面信息
         参数:
             pno: 页码
             page: PyMuPdf的Page对象
         返回值：
             page_info: 页面信息
         '''
-        # PDF页面图片存储路径
-        now = datetime.datetime.now().strftime('%Y%m%d%H%M%S')
-        suffix = ''.join(random.sample(string.ascii_letters + string.digits, 8))
-        img_left_save_path = os.path.join(self.media_root, 'temp_images', f"images_left_{pno}_{suffix}_{now}.png")
-        img_right_save_path = os.path.join(self.media_root, 'temp_images', f"images_right_{pno}_{suffix}_{now}.png")
-        self.img_save_paths.append(img_left_save_path)
-        self.img_save_paths.append(img_right_save_path)
+        page_info = {"pno": pno, "content": "", "image_count": 0, "table_count": 0, "new_structure": []}
+        for clip, _ in self.get_page_clips(page):
+            structure = self.get_vector_structure(pno, page, clip)
+            page_info["content"] += self.get_content_by_PPStructure(structure) # 页面内容
+            page_info["image_count"] += self.get_image_count(structure) # 图片数量
+            page_info["table_count"] += self.get_table_count(structure) # 表格数量
+            page_info["new_structure"] += self.get_image_table_count(structure) # 每一块下方的图片数量和表格数量
+        return page_info
+
+    def get_vector_structure(self, pno, page, clip=None):
+        '''
+        描述：
+            根据PDF中的对象得到与版面分析结果格式相同的版面结构
+            text: 文本层的文字块, 中心在表格或图片内的文字块不计入(与版面分析一致, 表格和图片中的文字不属于正文)
+            table: pdfplumber 检测到的至少2行2列的表格
+            figure: 面积足够大的图片, 以及由多条路径组成的矢量图形(图表)
+        参数:
+            pno: 页码
+            page: PyMuPdf的Page对象
+            clip: 裁剪区域 fitz.Rect, None表示整个页面
+        返回值：
+            structure: 版面结构 List[Dict], 坐标为 zoom_x 缩放下相对于clip的坐标
+        '''
+        clip = page.rect if clip is None else clip
+        def to_bbox(rect):
+            return [(rect[0] - clip.x0) * self.zoom_x, (rect[1] - clip.y0) * self.zoom_y, (rect[2] - clip.x0) * self.zoom_x, (rect[3] - clip.y0) * self.zoom_y]
+
+        table_rects = self.get_table_rects(pno, clip)
+        figure_rects = self.get_figure_rects(page, clip, table_rects)
+        structure = [{"type": "table", "bbox": to_bbox(rect), "res": ""} for rect in table_rects]
+        structure += [{"type": "figure", "bbox": to_bbox(rect), "res": ""} for rect in figure_rects]
+
+        for block in page.get_text("dict", clip=clip)["blocks"]:
+            # 图片块，跳过
+            if block["type"] != 0:
+                continue
+            middle_point = fitz.Point((block["bbox"][0] + block["bbox"][2]) * 0.5, (block["bbox"][1] + block["bbox"][3]) * 0.5)
+            if any([middle_point in rect for rect in table_rects + figure_rects]):
+                continue
+            res = []
+            for line in block["lines"]:
+                text = "".join([span["text"] for span in line["spans"]])
+                if text.strip() == "" or self.is_boilerplate_line(text, line["bbox"][1] - page.rect.y0, line["bbox"][3] - page.rect.y0, page.rect.height):
+                    continue
+                x0, y0, x1, y1 = to_bbox(line["bbox"])
+                res.append({"text": text, "confidence": 1.0, "text_region": [[x0, y0], [x1, y0], [x1, y1], [x0, y1]]})
+            if len(res):
+                structure.append({"type": "text", "bbox": to_bbox(block["bbox"]), "res": res})
+        return sort_structure(structure)
+
+    def get_table_rects(self, pno, clip):
+        '''
+        描述：使用pdfplumber检测页面中的表格, 只保留至少2行2列、与clip相交的表格
+        参数:
+            pno: 页码
+            clip: 裁剪区域 fitz.Rect
+        返回值：
+            rects: List[fitz.Rect] 表格区域, 已裁剪到clip内
+        '''
+        rects = []
+        for table in self.get_plumber_page(pno).find_tables():
+            row_count = len(set([cell[1] for cell in table.cells]))
+            col_count = len(set([cell[0] for cell in table.cells]))
+            rect = fitz.Rect(table.bbox) & clip
+            if row_count >= 2 and col_count >= 2 and not rect.is_empty:
+                rects.append(rect)
+        return rects
+
+    def get_figure_rects(self, page, clip, table_rects):
+        '''
+        描述：
+            获取页面中的图片和矢量图形的区域
+            相邻的矢量路径合并为一个图形, 包含至少 figure_min_paths 条路径、面积在 figure_min_area 和 figure_max_area 之间的才算图形
+            与表格重叠一半以上的图形(表格线)、被矢量图形包含的图片不重复计算
+        参数:
+            page: PyMuPdf的Page对象
+            clip: 裁剪区域 fitz.Rect
+            table_rects: 表格区域 List[fitz.Rect]
+        返回值：
+            rects: List[fitz.Rect] 图片和矢量图形的区域
+        '''
+        area = abs(clip)
+        def overlaps(rect, others):
+            return any([abs(rect & other) > abs(rect) * 0.5 for other in others])
 
+        # 矢量图形
+        paths = [path["rect"] & clip for path in page.get_drawings()]
+        paths = [rect for rect in paths if rect.x0 <= rect.x1 and rect.y0 <= rect.y1 and rect.width + rect.height > 0] # 在clip内的路径, 包括直线
+        paths = [rect for rect in paths if abs(rect) < area * self.figure_max_area] # 背景
+        relative = [[rect.x0 - clip.x0, rect.y0 - clip.y0, rect.x1 - clip.x0, rect.y1 - clip.y0] for rect in paths]
+        drawing_rects = []
+        for bbox, count in get_rect_clusters(relative, clip.width, clip.height):
+            rect = fitz.Rect(bbox[0] + clip.x0, bbox[1] + clip.y0, bbox[2] + clip.x0, bbox[3] + clip.y0)
+            if count >= self.figure_min_paths and area * self.figure_min_area <= abs(rect) <= area * self.figure_max_area and not overlaps(rect, table_rects):
+                drawing_rects.append(rect)
+
+        # 图片
+        image_rects = []
+        for info in page.get_image_info():
+            rect = fitz.Rect(info["bbox"]) & clip
+            if abs(rect) >= area * self.figure_min_area and not overlaps(rect, drawing_rects + table_rects + image_rects):
+                image_rects.append(rect)
+        return drawing_rects + image_rects
+
+    def get_plumber_page(self, pno):
+        '''
+        描述：获取pdfplumber的页面, pdfplumber已经关闭时重新打开
+        参数:
+            pno: 页码
+        返回值：
+            page: pdfplumber的Page对象
+        '''
+        if self.pdfplumber is None:
+            self.pdfplumber = pdfplumber.open(self.filepath)
+        return self.pdfplumber.pages[pno]
+
+    def close_pdfplumber(self):
+        '''
+        描述：关闭pdfplumber, 之后需要时由 get_plumber_page 重新打开
+        '''
+        if self.pdfplumber is not None:
+            self.pdfplumber.close()
+            self.pdfplumber = None
+
+    def get_page_clips(self, page):
+        '''
+        描述：
+            获取页面需要分别处理的区域, 单页为整个页面, 双页从中线分为左右两部分
+        参数:
+            page: PyMuPdf的Page对象
+        返回值：
+            clips: List[(裁剪区域 fitz.Rect 或 None, 位置标记)]
+        '''
         rect = page.rect # 页面矩形
+        if rect.width / rect.height <= 1.4:
+            return [(None, "")]
         middle_top_point = fitz.Point((rect.br[0] + rect.tl[0]) * 0.5, rect.tl[1]) # 中线上点
         middle_bottom_point = fitz.Point((rect.br[0] + rect.tl[0]) * 0.5, rect.br[1]) # 中线下点
         clip_left = fitz.Rect(rect.tl, middle_bottom_point) # 左边矩形
         clip_right = fitz.Rect(middle_top_point, rect.br) # 右边矩形
-        
-        # 保存图片
-        page.get_pixmap(matrix=self.mat, clip=clip_left).save(img_left_save_path)
-        page.get_pixmap(matrix=self.mat, clip=clip_right).save(img_right_save_path) 
-
-        # 利用 PPStructure 和 paddleocr 进行版面分析和文字提取
-        structure_left = self.pdf_ocr.get_structure(img_left_save_path)
-        structure_right = self.pdf_ocr.get_structure(img_right_save_path)
-
-        error_axis_x_left = 50 if self.is_single_colum(structure=structure_left) else 5 # 单栏双栏判断
-        error_axis_x_right = 50 if self.is_single_colum(structure=structure_right) else 5 # 单栏双栏判断
-
-        content = self.get_content_by_PaddleOCR(structure_left, img_left_save_path, error_axis_x_left)
-        content += self.get_content_by_PaddleOCR(structure_right, img_right_save_path, error_axis_x_right)
-        image_count = self.get_image_count(structure_left) + self.get_image_count(structure_right)
-        table_count = self.get_table_count(structure_left) + self.get_table_count(structure_right)
-        new_structure = self.get_image_table_count(structure_left) + self.get_image_table_count(structure_right)
-
-        page_info = {
-            "pno": pno,
-            "content": content,
-            "image_count": image_count,
-            "table_count": table_count,
-            "new_structure": new_structure
-        } 
-        return page_info
+        return [(clip_left, "left"), (clip_right, "right")]
+
+    def prepare_page(self, pno, use_cache=True, tier=None):
+        '''
+        描述：
+            页面处理的第一阶段, 所有访问PDF的操作都在这一阶段完成
+            读取缓存; 有文本层且延迟版面分析时直接得到页面信息; 否则渲染每个区域的图片并提取文本层
+        参数:
+            pno: 页码
+            use_cache: 是否读取缓存
+            tier: OCR页面的分辨率层级, None表示 cascade_ocr 为 True 时先初筛
+        返回值：
+            task: {
+                "pno": 页码,
+                "cached": 页面信息是否来自缓存,
+                "page_type": 页面类型,
+                "tier": 分辨率层级,
+                "double": 是否为双页,
+                "page_info": 已经得到的页面信息, 需要推理时为None,
+                "regions": 需要推理的区域 List[region]
+            }
+        '''
+        task = {"pno": pno, "cached": False, "page_info": None, "regions": [], "page_type": "text", "tier": "full", "double": False}
+        if use_cache and self.page_cache is not None:
+            page_info = self.page_cache.get(self.get_cache_key(pno))
+            if page_info is None and self.cascade_ocr and tier is None:
+                page_info = self.page_cache.get(self.get_cache_key(pno, "triage"))
+                if page_info is not None and self.is_topic_page(page_info["content"]):
+                    page_info, tier = None, "full" # 缓存的初筛结果命中主题词, 以正常分辨率重新识别
+            if page_info is not None:
+                task["page_info"], task["cached"], task["tier"] = page_info, True, page_info.get("tier", "full")
+                return task
+
+        with self.document_lock:
+            page = self.documnet[pno]
+            page_type = self.classify_page(page) if self.classify_pages else None
+            if page_type is not None:
+                # 空白页、整页图片、章节分隔页不进行OCR, 文字来自文本层, 图片数量来自PDF中的图片
+                task["page_type"] = page_type
+                task["page_info"] = self.get_skipped_page_info(pno, page)
+                return task
+
+            text_layer = self.has_text_layer(page)
+            task["page_type"] = "text" if text_layer else "ocr"
+            clips = self.get_page_clips(page) # 单页为整个页面, 双页分为左右两部分
+            task["double"] = len(clips) > 1
+            if self.vector_counting and text_layer:
+                # 根据PDF中的对象得到版面结构, 不需要推理
+                task["page_info"] = self.get_vector_page_info(pno, page)
+            elif self.lazy_layout and text_layer:
+                # 先只提取文字, 版面分析延迟到第一次访问图表数量时
+                content = "".join([self.get_text_layer_content(page, clip) for clip, _ in clips])
+                task["page_info"] = LazyPageInfo({"pno": pno, "content": content}, self.load_layout)
+            else:
+                if self.cascade_ocr and not text_layer and tier is None:
+                    task["tier"] = "triage" # 先低分辨率初筛
+                task["regions"] = self.prepare_regions(pno, page, text_layer, task["tier"])
+        return task
+
+    def infer_page(self, task):
+        '''
+        描述：页面处理的第二阶段, 对每个区域进行版面分析和文字识别, 不访问PDF
+        参数:
+            task: prepare_page 的返回值
+        返回值：
+            task: 每个区域增加了推理结果, 初筛的文字命中主题词时 needs_full 为 True
+        '''
+        regions = task["regions"]
+        if self.batch_recognition:
+            # 双页的左右两部分一起检测, 文字行一起提交给批处理服务
+            ocr_regions = [region for region in regions if not region["text_layer"]]
+            if len(ocr_regions):
+                results = self.pdf_ocr.get_ocr_results_batched([region["img"] for region in ocr_regions], [region["scale"] for region in ocr_regions])
+                for region, lines in zip(ocr_regions, results):
+                    region["lines"] = lines
+        start_time = time.time()
+        task["regions"] = [self.infer_region(region) for region in regions]
+        if len(regions):
+            self.inference_time += time.time() - start_time
+            self.inference_pages += 1
+
+        if task["tier"] == "triage":
+            content = "".join([self.finish_region(region)[0] for region in task["regions"]])
+            # 初筛文字命中主题词, 需要由第一阶段以正常分辨率重新渲染, 见 prepare_full_page
+            task["needs_full"] = self.is_topic_page(content)
+        return task
+
+    def prepare_full_page(self, task):
+        '''
+        描述：初筛命中主题词的页面以正常分辨率重新渲染, 属于第一阶段, 初筛的耗时也计入这一页
+        参数:
+            task: needs_full 为 True 的 infer_page 返回值
+        返回值：
+            task: prepare_page 的返回值
+        '''
+        full_task = self.run_stage(self.prepare_page, task["pno"], use_cache=False, tier="full")
+        full_task["elapsed"] += task.get("elapsed", 0.0)
+        return full_task
+
+    def infer_page_inline(self, task):
+        '''
+        描述：在同一个线程中完成推理, 初筛命中主题词时直接重新渲染并推理, 用于不使用流水线的处理
+        参数:
+            task: prepare_page 的返回值
+        返回值：
+            task: infer_page 的返回值
+        '''
+        task = self.run_stage(self.infer_page, task)
+        if task.get("needs_full"):
+            task = self.run_stage(self.infer_page, self.prepare_full_page(task))
+        return task
+
+    def is_topic_page(self, content):
+        '''
+        描述：判断初筛的页面内容是否包含主题词, 没有设置主题词时都需要重新识别
+        参数:
+            content: 页面内容
+        返回值：
+            True: 需要以正常分辨率重新识别
+        '''
+        if len(self.topic_keywords) == 0:
+            return True
+        return any([word in content for word in self.topic_keywords])
+
+    def finish_page(self, task, use_cache=True):
+        '''
+        描述：页面处理的第三阶段, 组装页面信息并写入缓存
+        参数:
+            task: infer_page 的返回值
+            use_cache: 是否写入缓存
+        返回值：
+            page_info: 页面信息
+        '''
+        start_time = time.time()
+        pno = task["pno"]
+        page_info = task["page_info"]
+        if page_info is None:
+            page_info = {"pno": pno, "content": "", "image_count": 0, "table_count": 0, "new_structure": []}
+            for region in task["regions"]:
+                content, structure = self.finish_region(region)
+                page_info["content"] += content # 页面内容
+                page_info["image_count"] += self.get_image_count(structure) # 图片数量
+                page_info["table_count"] += self.get_table_count(structure) # 表格数量
+                page_info["new_structure"] += self.get_image_table_count(structure) # 每一块下方的图片数量和表格数量
+        if not task["cached"]:
+            page_info["page_type"] = task["page_type"] # 页面类型
+            page_info["tier"] = task["tier"] # 分辨率层级
+
+        if use_cache and self.page_cache is not None and not task["cached"]:
+            self.page_cache.set(self.get_cache_key(pno, task["tier"]), self.pdf_hash, pno, page_info)
+        self.page_timings.append((self.get_timing_category(task), task.get("elapsed", 0.0) + time.time() - start_time))
+        return self.attach_layout_loader(page_info)
+
+    def prepare_regions(self, pno, page, text_layer, tier="full"):
+        '''
+        描述：
+            渲染页面中需要分别推理的区域
+            双页只渲染一次整页, 在中缝处切分图片(不复制像素), 两部分的文本层按切分位置分别提取
+        参数:
+            pno: 页码
+            page: PyMuPdf的Page对象
+            text_layer: 是否使用文本层
+            tier: 分辨率层级, triage 使用 triage_zoom 渲染
+        返回值：
+            regions: List[region], region 同 prepare_region 的返回值
+        '''
+        clips = self.get_page_clips(page)
+        if len(clips) == 1:
+            return [self.prepare_region(pno, page, text_layer, tier=tier)]
+
+        zoom = self.get_tier_zoom(page, clips[0][0], text_layer, tier) # 按半页计算缩放比例, 与分别渲染时一致
+        img = self.render_page(pno, page, zoom=zoom) # 渲染整页图片
+        scale = 1.0 if zoom is None else self.zoom_x / zoom # 把坐标统一到 zoom_x 缩放下
+        gutter = self.get_gutter(img) if self.detect_gutter else img.shape[1] // 2 # 中缝的像素位置
+
+        rect = page.rect
+        middle_x = rect.x0 + gutter / (self.zoom_x if zoom is None else zoom) # 中缝在页面中的横坐标
+        clip_left = fitz.Rect(rect.x0, rect.y0, middle_x, rect.y1) # 左边矩形
+        clip_right = fitz.Rect(middle_x, rect.y0, rect.x1, rect.y1) # 右边矩形
+        regions = []
+        for clip, img_half in [(clip_left, img[:, :gutter]), (clip_right, img[:, gutter:])]:
+            lines = self.get_text_layer_lines(page, clip) if text_layer else None
+            regions.append({"img": img_half, "scale": scale, "text_layer": text_layer, "lines": lines, "page_height": rect.height})
+        return regions
+
+    def get_gutter(self, img):
+        '''
+        描述：
+            检测双页图片的中缝位置
+            在中线左右 gutter_search_ratio 的范围内, 找墨迹最少的一列, 多列相同时取最靠近中线的
+            中缝处也有大量墨迹(例如跨页图片)时, 返回中线位置
+        参数:
+            img: 整页图像 np.ndarray
+        返回值：
+            gutter: int 中缝的像素横坐标
+        '''
+        height, width = img.shape[:2]
+        middle = width // 2
+        start = max(1, int(width * (0.5 - self.gutter_search_ratio)))
+        end = min(width - 1, int(width * (0.5 + self.gutter_search_ratio)) + 1)
+        if end <= start:
+            return middle
+
+        band = img[:, start:end]
+        band = band.min(axis=2) if band.ndim == 3 else band # 最暗的通道
+        ink = (band < 200).sum(axis=0).astype(np.float64) # 每一列的墨迹像素数
+        window = max(1, (end - start) // 50) # 平滑, 避免单列的空隙
+        # 两端用边缘的值填充, 补零会使搜索范围两端的墨迹偏少, 中缝被误判在范围边缘
+        ink = np.pad(ink, (window // 2, window - 1 - window // 2), mode="edge")
+        ink = np.convolve(ink, np.ones(window) / window, mode="valid")
+        if ink.min() > height * 0.5:
+            return middle
+        candidates = np.flatnonzero(ink == ink.min()) + start
+        return int(candidates[np.argmin(np.abs(candidates - middle))])
+
+    def get_tier_zoom(self, page, clip=None, text_layer=False, tier="full"):
+        '''
+        描述：获取分辨率层级对应的缩放比例, 初筛使用 triage_zoom, 否则同 get_page_zoom
+        返回值：
+            zoom: float 缩放比例, None表示使用 self.mat
+        '''
+        if tier == "triage":
+            return float(self.triage_zoom)
+        return self.get_page_zoom(page, clip, text_layer)
+
+    def prepare_region(self, pno, page, text_layer, clip=None, position="", tier="full"):
+        '''
+        描述：渲染区域图片, 有文本层时同时提取文本层的文字行
+        参数:
+            pno: 页码
+            page: PyMuPdf的Page对象
+            text_layer: 是否使用文本层
+            clip: 裁剪区域 fitz.Rect, None表示整个页面
+            position: 图片名中的位置标记, 例如 left、right
+            tier: 分辨率层级
+        返回值：
+            region: {"img": 图像, "scale": 坐标缩放比例, "text_layer": 是否使用文本层, "lines": 文本层的文字行或None, "page_height": 页面高度(磅)}
+        '''
+        zoom = self.get_tier_zoom(page, clip, text_layer, tier)
+        img = self.render_page(pno, page, clip, position, zoom) # 渲染PDF页面图片
+        scale = 1.0 if zoom is None else self.zoom_x / zoom # 把坐标统一到 zoom_x 缩放下, 阈值才能通用
+        lines = self.get_text_layer_lines(page, clip) if text_layer else None
+        return {"img": img, "scale": scale, "text_layer": text_layer, "lines": lines, "page_height": page.rect.height}
+
+    def infer_region(self, region):
+        '''
+        描述：对区域图片进行版面分析和文字识别, 推理完成后释放图片
+        参数:
+            region: prepare_region 的返回值
+        返回值：
+            region: 增加了 structure 版面分析结果, OCR页面的 lines 为整页识别的文字行
+        '''
+        img, scale = region.pop("img"), region["scale"]
+        if region["text_layer"]:
+            region["structure"] = self.pdf_ocr.get_layout(img, scale=scale)
+        elif self.batch_recognition:
+            # 版面分析不做识别, 整页检测出的文字行批量识别后分配到版面块中
+            region["structure"] = self.pdf_ocr.get_layout(img, scale=scale)
+            if region["lines"] is None:
+                region["lines"] = self.pdf_ocr.get_ocr_result_batched(img, scale=scale)
+        else:
+            region["structure"] = self.pdf_ocr.get_structure(img, scale=scale) # 速度比较慢
+            if not self.single_pass:
+                region["lines"] = self.pdf_ocr.get_ocr_result(img, scale=scale) # 整页OCR [速度慢]
+        return region
+
+    def finish_region(self, region):
+        '''
+        描述：根据推理结果获取区域的文本内容
+        参数:
+            region: infer_region 的返回值
+        返回值：
+            content: 文本内容
+            structure: 版面分析结果 List[Dict]
+        '''
+        structure = region["structure"]
+        self.strip_boilerplate_lines(region)
+        error_axis_x = 50 if self.is_single_colum(structure=structure) else 5 # 单栏双栏判断
+        if region["text_layer"] or self.batch_recognition:
+            content = self.get_content_by_lines(structure, region["lines"], error_axis_x) # 页面内容 by PyMuPDF 或 批量识别
+        elif self.single_pass:
+            content = self.get_content_by_PPStructure(structure) # 页面内容 by PPStructure
+        else:
+            content = self.get_content_by_PaddleOCR(structure, None, error_axis_x, ocr_result=region["lines"]) # 页面内容 by PaddleOCR
+        return content, structure
+
+    def strip_boilerplate_lines(self, region):
+        '''
+        描述：
+            去除OCR识别出的页眉、页脚文字行, 文本层的文字行在 get_text_layer_lines 中已经去除
+            识别结果的坐标为 zoom_y 缩放下相对于页面顶部的坐标
+        参数:
+            region: infer_region 的返回值, 修改其中的 lines 和 structure
+        '''
+        if not self.get_boilerplate() or region["text_layer"]:
+            return
+        height = region["page_height"]
+        def is_boilerplate(text, box):
+            return self.is_boilerplate_line(text, box[0][1] / self.zoom_y, box[2][1] / self.zoom_y, height)
+
+        if region["lines"] is not None:
+            region["lines"] = [line for line in region["lines"] if not is_boilerplate(line[1][0], line[0])]
+        for item in region["structure"]:
+            if item["type"] == "text" and isinstance(item["res"], list):
+                item["res"] = [line for line in item["res"] if "text_region" not in line or not is_boilerplate(line["text"], line["text_region"])]
+
+    def get_page_zoom(self, page, clip=None, text_layer=False):
+        '''
+        描述：
+            自适应分辨率模式下, 根据页面特征选择渲染的缩放比例
+            1. 有文本层的页面只需要版面分析, 使用最小缩放比例
+            2. 根据文本层中的主要字号, 使文字渲染后的高度约为 target_text_height 像素
+            3. 没有字号信息的扫描页, 不超过页面中图片的原始分辨率
+            4. 渲染后图片的长边不超过 max_image_side 像素
+        参数:
+            page: PyMuPdf的Page对象
+            clip: 裁剪区域 fitz.Rect, None表示整个页面
+            text_layer: 是否使用文本层
+        返回值：
+            zoom: float 缩放比例, 未开启自适应分辨率时返回None
+        '''
+        if not self.adaptive_zoom:
+            return None
+
+        rect = page.rect if clip is None else clip
+        if text_layer:
+            zoom = self.min_zoom
+        else:
+            font_size = self.get_dominant_font_size(page, clip)
+            if font_size:
+                zoom = self.target_text_height / font_size
+            else:
+                zoom = self.zoom_x
+                native_zoom = self.get_native_image_zoom(page)
+                if native_zoom:
+                    zoom = min(zoom, native_zoom)
+        zoom = min(zoom, self.max_image_side / max(rect.width, rect.height))
+        return float(min(max(zoom, self.min_zoom), self.max_zoom))
+
+    def get_dominant_font_size(self, page, clip=None):
+        '''
+        描述：获取文本层中字符数最多的字号
+        参数:
+            page: PyMuPdf的Page对象
+            clip: 裁剪区域 fitz.Rect, None表示整个页面
+        返回值：
+            font_size: float 字号(磅), 没有文本层时返回None
+        '''
+        size_count = {} # {字号: 字符数}
+        for block in page.get_text("dict", clip=clip)["blocks"]:
+            if block["type"] != 0:
+                continue
+            for line in block["lines"]:
+                for span in line["spans"]:
+                    size = round(span["size"] * 2) / 2 # 按0.5磅合并
+                    size_count[size] = size_count.get(size, 0) + len(span["text"].strip())
+        size_count = {size: count for size, count in size_count.items() if size > 0 and count > 0}
+        if len(size_count) == 0:
+            return None
+        return max(size_count, key=size_count.get)
+
+    def get_native_image_zoom(self, page):
+        '''
+        描述：获取页面中最大图片的原始分辨率对应的缩放比例, 渲染超过该比例不会增加信息
+        参数:
+            page: PyMuPdf的Page对象
+        返回值：
+            zoom: float 缩放比例, 没有图片时返回None
+        '''
+        images = [info for info in page.get_image_info() if fitz.Rect(info["bbox"]).width > 0]
+        if len(images) == 0:
+            return None
+        largest = max(images, key=lambda info: abs(fitz.Rect(info["bbox"])))
+        return largest["width"] / fitz.Rect(largest["bbox"]).width
+
+    def render_page(self, pno, page, clip=None, position="", zoom=None):
+        '''
+        描述：
+            把PDF页面渲染为内存中的图像, 不写入磁盘
+            save_temp_images 为 True 时另外保存一份PNG到 temp_images 中用于调试
+        参数:
+            pno: 页码
+            page: PyMuPdf的Page对象
+            clip: 裁剪区域 fitz.Rect, None表示整个页面
+            position: 图片名中的位置标记, 例如 left、right
+            zoom: 缩放比例, None表示使用 self.mat
+        返回值：
+            img: BGR图像 np.ndarray
+        '''
+        colorspace = fitz.csGRAY if self.grayscale else fitz.csRGB
+        mat = self.mat if zoom is None else fitz.Matrix(zoom, zoom)
+        pix = page.get_pixmap(matrix=mat, clip=clip, colorspace=colorspace, alpha=False)
+        img = pixmap_to_array(pix)
+
+        if self.save_temp_images:
+            now = datetime.datetime.now().strftime('%Y%m%d%H%M%S')
+            suffix = ''.join(random.sample(string.ascii_letters + string.digits, 8))
+            position = f"_{position}" if position else ""
+            img_save_path = os.path.join(self.media_root, 'temp_images', f"images{position}_{pno}_{suffix}_{now}.png")
+            pix.save(img_save_path)
+            self.img_save_paths.append(img_save_path)
+        return img
 
     def get_content_by_PPStructure(self, structure):
         """
         描述：
             使用 PPStructure 获取文本内容
+            PPStructure(ocr=True) 已经识别了每个版面块内的文字, 不需要再进行一次整页OCR
+            块内的行按Y轴排序, 与 get_content_by_PaddleOCR 的顺序一致
         参数：
             structure: 版面分析结果 List[Dict]
         返回值：
@@ -176,46 +1259,164 @@ class PdfProcessor():
         content = ""
         for item in structure:
             if item["type"] == "text":
-                for line in item["res"]:
+                lines = item["res"]
+                if len(lines) and "text_region" in lines[0]:
+                    # text_region: [[左上x, 左上y], [右上x, 右上y], [右下x, 右下y], [左下x, 左下y]]
+                    lines = sorted(lines, key=lambda x: ((x["text_region"][0][1] + x["text_region"][2][1])*0.5))
+                for line in lines:
                     content += line["text"]
         content = clean_content(content)
         return content
 
-    def get_content_by_PaddleOCR(self, structure, img_save_path, error_axis_x):
+    def get_content_by_PaddleOCR(self, structure, img, error_axis_x, scale=1.0, ocr_result=None):
         """
         描述：
             使用 PaddleOCR + PPStructure 获取文本内容
             精度高，速度慢
         参数：
             structure: 版面分析结果 List[Dict]
+            img: 页面图像 np.ndarray
+            error_axis_x: x轴允许误差
+            scale: 坐标缩放比例
+            ocr_result: 已经得到的paddle ocr识别结果, None时对img进行识别
         返回值：
             content: 文本内容
         """
         # 获取paddle ocr的识别结果
-        ocr_result = self.pdf_ocr.get_ocr_result(img_save_path)
-
-        # 获取文字部分的Bbox
-        text_bboxes = self.get_text_bboxes(structure)
+        if ocr_result is None:
+            ocr_result = self.pdf_ocr.get_ocr_result(img, scale=scale)
 
         content = ""
         # 遍历已排序完成的structure的text_bboxes
-        for text_bbox in text_bboxes:
-            block_res = [] # 存放块中的内容
-            for line in ocr_result:
-                # 提取line的bbox [左上x, 左上y, 右下x, 右下y]
-                bbox = [line[0][0][0], line[0][0][1], line[0][2][0], line[0][2][1]]
-                # 判断line的bbox是否在text_bbox中
-                flag = self.is_in_bboxes(bbox, [text_bbox], error_axis_x=error_axis_x, error_axis_y=2)
-                if flag:
-                    block_res.append(line)
-            
-            # 对块内的内容按Y轴排序
-            block_res = sorted(block_res, key=lambda x: ((x[0][0][1] + x[0][2][1])*0.5))
+        for block_res in self.get_lines_in_text_bboxes(structure, ocr_result, error_axis_x):
             content += "".join([line[1][0] for line in block_res])
     
         content = clean_content(content)
         return content
 
+    def get_content_by_lines(self, structure, lines, error_axis_x):
+        """
+        描述：
+            使用 文字行 + PPStructure 获取文本内容
+            文字行来自PDF文本层或批量识别, 按版面分析的文字块进行排序，并回填到structure的res中
+        参数：
+            structure: 版面分析结果 List[Dict]
+            lines: 文字行 List[item]，格式同 MyOCR.get_ocr_result
+            error_axis_x: x轴允许误差
+        返回值：
+            content: 文本内容
+        """
+        text_items = [item for item in structure if item["type"] == "text"]
+        blocks_res = self.get_lines_in_text_bboxes(structure, lines, error_axis_x)
+
+        content = ""
+        for item, block_res in zip(text_items, blocks_res):
+            # 回填每一块的文字, 供 get_image_table_count 使用
+            item["res"] = [{"text": line[1][0], "confidence": line[1][1], "text_region": line[0]} for line in block_res]
+            content += "".join([line[1][0] for line in block_res])
+
+        content = clean_content(content)
+        return content
+
+    def get_lines_in_text_bboxes(self, structure, lines, error_axis_x):
+        """
+        描述：把每一行分配到structure的文字块中
+        参数：
+            structure: 版面分析结果 List[Dict]
+            lines: 文字行 List[item]，格式同 MyOCR.get_ocr_result
+            error_axis_x: x轴允许误差
+        返回值：
+            blocks_res: List[List[item]] 每一个文字块中的行，块内按Y轴排序
+        """
+        # 获取文字部分的Bbox
+        text_bboxes = self.get_text_bboxes(structure)
+        if len(lines) == 0:
+            return [[] for _ in text_bboxes]
+
+        # 提取每一行的bbox [左上x, 左上y, 右下x, 右下y]
+        line_bboxes = np.array([[line[0][0][0], line[0][0][1], line[0][2][0], line[0][2][1]] for line in lines], dtype=np.float64)
+        # 一次判断所有line的bbox是否在每一个text_bbox中 (行数, 块数)
+        inside = get_containment_matrix(line_bboxes, text_bboxes, error_axis_x=error_axis_x, error_axis_y=2)
+        line_y_mean = (line_bboxes[:, 1] + line_bboxes[:, 3]) * 0.5
+
+        blocks_res = []
+        for idx_block in range(len(text_bboxes)):
+            idx_lines = np.flatnonzero(inside[:, idx_block]) # 块中的行
+            # 对块内的内容按Y轴排序
+            idx_lines = idx_lines[np.argsort(line_y_mean[idx_lines], kind="stable")]
+            blocks_res.append([lines[idx] for idx in idx_lines])
+        return blocks_res
+
+    def has_text_layer(self, page):
+        """
+        描述：
+            判断页面是否有可用的文本层
+            扫描件、纯图片页面没有文本层；字体缺少编码映射时提取出的文字为乱码
+            图片覆盖比例超过 text_layer_max_image_coverage 的页面(信息图、扫描正文加文字标题)需要OCR, 否则图片中的文字会丢失
+        参数：
+            page: PyMuPdf的Page对象
+        返回值：
+            True: 文本层可用
+            False: 文本层不可用, 需要OCR
+        """
+        if not self.use_text_layer:
+            return False
+        text = clean_content(page.get_text("text"))
+        if len(text) < self.text_layer_min_length:
+            return False
+        # 替换字符和私有区字符说明字体没有正确的编码映射
+        garbled_count = len([char for char in text if char == "\ufffd" or "\ue000" <= char <= "\uf8ff"])
+        if garbled_count / len(text) > self.text_layer_max_garbled:
+            return False
+        return self.get_image_coverage(page) <= self.text_layer_max_image_coverage
+
+    def get_text_layer_lines(self, page, clip=None):
+        """
+        描述：
+            从PDF文本层中获取每一行的文字和位置, 不包含页眉页脚
+            坐标转换到渲染后图片的坐标系，与版面分析结果对应
+        参数：
+            page: PyMuPdf的Page对象
+            clip: 裁剪区域 fitz.Rect, None表示整个页面
+        返回值：
+            lines: 文字行 List[item]，格式同 MyOCR.get_ocr_result
+            item: [[[左上x, 左上y], [右上x, 右上y], [右下x, 右下y], [左下x, 左下y]], (文本, 置信度)]
+        """
+        clip = page.rect if clip is None else clip
+        page_dict = page.get_text("dict", clip=clip)
+
+        lines = []
+        for block in page_dict["blocks"]:
+            # 图片块，跳过
+            if block["type"] != 0:
+                continue
+            for line in block["lines"]:
+                text = "".join([span["text"] for span in line["spans"]])
+                if text.strip() == "":
+                    continue
+                if self.is_boilerplate_line(text, line["bbox"][1] - page.rect.y0, line["bbox"][3] - page.rect.y0, page.rect.height):
+                    continue # 页眉、页脚、页码
+                x0 = (line["bbox"][0] - clip.x0) * self.zoom_x
+                y0 = (line["bbox"][1] - clip.y0) * self.zoom_y
+                x1 = (line["bbox"][2] - clip.x0) * self.zoom_x
+                y1 = (line["bbox"][3] - clip.y0) * self.zoom_y
+                lines.append([[[x0, y0], [x1, y0], [x1, y1], [x0, y1]], (text, 1.0)])
+        return lines
+
+    def get_text_layer_content(self, page, clip=None):
+        """
+        描述：
+            不进行版面分析, 直接按文本层的阅读顺序获取文本内容
+        参数：
+            page: PyMuPdf的Page对象
+            clip: 裁剪区域 fitz.Rect, None表示整个页面
+        返回值：
+            content: 文本内容
+        """
+        lines = self.get_text_layer_lines(page, clip)
+        content = "".join([line[1][0] for line in lines])
+        return clean_content(content)
+
     def get_image_count(self, structure):
         """
         描述：获取图片数量
@@ -248,6 +1449,8 @@ class PdfProcessor():
         '''
         描述：
             获取每一个文字块下方的图片数量和表格数量
+            每个图片、表格归属于同一栏中上方最近的文字块, 横跨多栏的块与每一栏都属于同一栏
+            每一栏的文字块按底部y坐标排序后二分查找, 复杂度 O(n log n)
         参数：  
             structure: 版面分析结果 List[Dict]
         返回值：    
@@ -258,58 +1461,44 @@ class PdfProcessor():
                 "table_count": 文字块下方的表格数量
             }
         '''
-        # 新的版面结构，包含每一块的类型、y坐标、[内容]
-        new_structure = []
-        for item in structure:
-            axis_x_top  = item["bbox"][0]
-            axis_y_top  = item["bbox"][1]
-            axis_x_bottom = item["bbox"][2]
-            axis_y_bottom = item["bbox"][3]
-            axis_y_mean = np.mean([axis_y_top, axis_y_bottom])
-            axis_x_mean = np.mean([axis_x_top, axis_x_bottom])
-            tmp = {"type": item["type"], "axis_y_top": axis_y_top, "axis_x_top": axis_x_top, 
-                    "axis_y_bottom": axis_y_bottom, "axis_x_bottom": axis_x_bottom, "axis_y_mean": axis_y_mean, "axis_x_mean": axis_x_mean}
+        # 只保留text、table、figure类型的块
+        items = [item for item in structure if item["type"] in ["text", "table", "figure"]]
+        text_items = [item for item in items if item["type"] == "text"]
+        image_count = np.zeros(len(items), dtype=np.int64)
+        table_count = np.zeros(len(items), dtype=np.int64)
+
+        if len(text_items) and len(text_items) < len(items):
+            # 每一块的坐标 [左上角x，左上角y，右下角x，右下角y]
+            bboxes = np.array([item["bbox"] for item in items], dtype=np.float64).reshape(-1, 4)
+            types = np.array([item["type"] for item in items])
+            column_ids = get_column_ids(bboxes, axis=50) # 与 is_single_colum 使用相同的单栏判断
+
+            # 文字块按底部y坐标排序
+            text_idx = np.flatnonzero(types == "text")
+            text_idx = text_idx[np.argsort(bboxes[text_idx, 3], kind="stable")]
+            other_idx = np.flatnonzero(types != "text")
+
+            for column_id in np.unique(column_ids[other_idx]):
+                targets = other_idx[column_ids[other_idx] == column_id] # 这一栏的图片和表格
+                if column_id == -1:
+                    candidates = text_idx # 横跨多栏的图表可以归属于任意一栏的文字块
+                else:
+                    candidates = text_idx[(column_ids[text_idx] == column_id) | (column_ids[text_idx] == -1)]
+                if len(candidates) == 0:
+                    continue
+                # 底部不低于图表顶部的文字块中, 最靠下的一个
+                pos = np.searchsorted(bboxes[candidates, 3], bboxes[targets, 1] + self.overlap_tolerance, side="right") - 1
+                found = pos >= 0
+                owners, targets = candidates[pos[found]], targets[found]
+                np.add.at(image_count, owners[types[targets] == "figure"], 1)
+                np.add.at(table_count, owners[types[targets] == "table"], 1)
+
+        # 保留text类型的 content、image_count、table_count字段
+        res_structure = []
+        for i, item in enumerate(items):
             if item["type"] == "text":
                 content = "".join([line["text"] for line in item["res"]])
-                tmp["content"] = content
-                new_structure.append(tmp)
-            elif item["type"]  in ["table", "figure"]:
-                new_structure.append(tmp)
-        
-        # 遍历每一块，获取阈值内的图片数量和表格数量
-        for i, item in enumerate(new_structure):
-            if item["type"] == "text":
-                item["image_count"] = 0
-                item["table_count"] = 0
-                for j in range(i+1, len(new_structure)):
-                    all_in = False
-                    left_axis = 0
-                    right_axis = 0
-                    if abs(new_structure[j]["axis_x_top"]-item["axis_x_top"]) > 5:
-                        left_axis = new_structure[j]["axis_x_top"]-item["axis_x_top"]
-                    if abs(new_structure[j]["axis_x_bottom"]-item["axis_x_bottom"]) > 5:
-                        right_axis = new_structure[j]["axis_x_bottom"]-item["axis_x_bottom"]
-                    if left_axis * right_axis <= 0:
-                        all_in = True    
-                    # FIXME 下一块在当前块的上方，这个判断值为负数，需要修改
-                    # FIXME 双列情况
-                    if abs(new_structure[j]["axis_y_top"] - item["axis_y_bottom"]) < self.y_threshold and new_structure[j]["axis_x_mean"] - item["axis_x_mean"] < self.x_threshold:
-                        # 如果下一块的顶部y坐标与当前块的底部y坐标的差小于阈值，且下一块的x轴与当前块的x轴相差小于阈值（在同一排）则计数
-                        if new_structure[j]["type"] == "figure":
-                            item["image_count"] += 1
-                        elif new_structure[j]["type"] == "table":
-                            item["table_count"] += 1
-                    elif all_in:
-                        if new_structure[j]["type"] == "figure":
-                            item["image_count"] += 1
-                        elif new_structure[j]["type"] == "table":
-                            item["table_count"] += 1
-                        # 如果下一块的顶部y坐标与当前块的底部y坐标的差大于阈值，则跳出循环
-                    else:
-                        break
-        
-        # 保留text类型的 content、image_count、table_count字段
-        res_structure = [{k: item[k] for k in ["content", "image_count", "table_count"]} for item in new_structure if item["type"] == "text"]
+                res_structure.append({"content": content, "image_count": int(image_count[i]), "table_count": int(table_count[i])})
 
         return res_structure
 
@@ -367,19 +1556,85 @@ class PdfProcessor():
             true:单栏页面
             false:多栏页面
         """
-        axis = 50 # 误差值
-        middle_point = []
-        for item in structure:
-            middle_point.append(item["middle_point"])
-        sorted_middle_point = sorted(middle_point, key= lambda t:t[1]) # 按照纵坐标升序
-        for index in range(0,len(sorted_middle_point) - 1):
-            temp1 = sorted_middle_point[index + 1][0] - sorted_middle_point[index][0] # 横坐标差值
-            temp2 = sorted_middle_point[index + 1][1] - sorted_middle_point[index][1] # 纵坐标差值
-            if temp2 <= axis and temp1 >= axis: # 横坐标差值大于误差且纵坐标差值小于误差，则判断为多栏
-                return False
-        return True
+        middle_points = [item["middle_point"] for item in structure]
+        return is_single_column_points(middle_points, axis=50)
         
 
+class LazyPageInfo(dict):
+    '''
+    描述：
+        延迟版面分析的页面信息
+        pno、content 立即可用, image_count、table_count、new_structure 第一次访问时调用 loader 计算
+        序列化(json、pickle)时只包含已经计算的字段
+    参数：
+        page_info: 页面信息, 至少包含 pno 和 content
+        loader: 计算版面分析字段的函数, 输入页面信息, 返回 {"image_count", "table_count", "new_structure"}
+    '''
+    layout_keys = ("image_count", "table_count", "new_structure")
+
+    def __init__(self, page_info, loader) -> None:
+        super().__init__(page_info)
+        self.loader = loader
+
+    def __missing__(self, key):
+        if key not in self.layout_keys:
+            raise KeyError(key)
+        self.update(self.loader(self))
+        return self[key]
+
+    def __reduce__(self):
+        # 传给其他进程时不携带loader, 接收方通过 PdfProcessor.attach_layout_loader 重新包装
+        return (dict, (dict(self),))
+
+
+# 子进程中的PdfProcessor, 每个子进程只创建一次
+worker_processor = None
+
+def init_worker(filepath, media_root, cpu_threads, options, page_cache=None, pdf_hash=None):
+    """
+    描述：
+        子进程初始化, 打开PDF并加载OCR模型
+    参数：
+        filepath: PDF文件路径
+        media_root: 保存图片的路径
+        cpu_threads: OCR引擎使用的CPU线程数
+        options: 主进程的页面处理参数 PdfProcessor.get_options()
+        page_cache: PageCache 页面缓存
+        pdf_hash: PDF内容哈希, 避免每个子进程重复计算
+    """
+    global worker_processor
+    worker_processor = PdfProcessor(filepath, media_root, processing_number=1, cpu_threads=cpu_threads, page_cache=page_cache)
+    worker_processor.set_options(options)
+    worker_processor._pdf_hash = pdf_hash
+    worker_processor.pdf_ocr # 启动时加载OCR模型
+
+def process_page_in_worker(pno):
+    """
+    描述：
+        在子进程中处理一页PDF
+    参数：
+        pno: 页码
+    返回值：
+        page_info: 页面信息
+        timing: (类别, 秒) 这一页的耗时, 见 PdfProcessor.get_timing_category
+    """
+    page_info = worker_processor.process_page(pno)
+    return page_info, worker_processor.page_timings[-1]
+
+
+def get_line_fingerprint(text):
+    """
+    描述：
+        文字行的指纹, 用于比较不同页面的页眉页脚
+        清洗后把连续数字替换为#, 页码、年份不同的行得到相同的指纹
+    参数：
+        text: 文字行
+    返回值：
+        fingerprint: str
+    """
+    return re.sub(r"\d+", "#", clean_content(text))
+
+
 def clean_content(content):
     """
     描述：
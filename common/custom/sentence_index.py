@@ -0,0 +1,162 @@
+'''
+SentenceIndex类、Paragraph类
+文档级的句子索引: 所有页面的句子保存在一个数组中, 记录每一页的起始下标
+前后 N 句的窗口直接对数组切片, 不需要重复切分句子
+分词结果建立倒排索引(词 -> 句子下标), 关键词组合的匹配变为集合的并集和交集
+'''
+import re
+from bisect import bisect_right
+from collections import defaultdict
+
+from common.custom.tokenizer import get_tokenizer
+
+# 按句号、感叹号、问号切分句子, 与 keywords_processor 中的切分方式一致
+SENTENCE_PATTERN = re.compile(r'[^。!！?？]*[。!！?？]')
+
+
+class Paragraph(str):
+    '''
+    描述：
+        段落文本, 与普通字符串相同, 同时保存切分好的句子
+        get_sentences_with_keywords 直接使用保存的句子, 不需要再切分
+    参数：
+        text: 段落文本
+        sentences: List[str] 段落中的句子
+        sentence_ids: 句子在 sentence_index 中的下标, None表示句子不来自句子索引
+        sentence_index: SentenceIndex
+    '''
+    def __new__(cls, text, sentences, sentence_ids=None, sentence_index=None):
+        paragraph = super().__new__(cls, text)
+        paragraph.sentences = tuple(sentences)
+        paragraph.sentence_ids = None if sentence_ids is None else tuple(sentence_ids)
+        paragraph.sentence_index = sentence_index
+        return paragraph
+
+
+class SentenceIndex():
+    '''
+    描述：
+        文档的句子索引, 构建一次后供所有按句子处理的函数使用
+        句子的切分与对每一页 re.findall(SENTENCE_PATTERN, content) 相同, 最后一个句号之后的文字不属于任何句子
+        倒排索引只包含已经用到的句子, 见 index_tokens
+    参数：
+        document_info: Document 文档信息
+    '''
+    def __init__(self, document_info) -> None:
+        self.sentences = [] # 所有页面的句子
+        self.ends = [] # 每个句子在所在页面内容中的结束位置
+        self.page_starts = [0] # 每一页第一个句子的下标, 最后一项为句子总数
+        for page_info in document_info:
+            for match in SENTENCE_PATTERN.finditer(page_info["content"]):
+                self.sentences.append(match.group())
+                self.ends.append(match.end())
+            self.page_starts.append(len(self.sentences))
+        self.postings = defaultdict(set) # 倒排索引 {词: {句子下标}}
+        self.indexed = set() # 已经加入倒排索引的句子下标
+
+    @property
+    def page_count(self):
+        return len(self.page_starts) - 1
+
+    def get_page_sentences(self, idx_page):
+        """
+        描述：获取一页的所有句子
+        参数：
+            idx_page: 页面下标
+        返回值：
+            sentences: List[str]
+        """
+        return self.sentences[self.page_starts[idx_page]: self.page_starts[idx_page + 1]]
+
+    def get_sentence_id(self, idx_page, offset, length):
+        """
+        描述：获取页面内容中一段文字所在的句子
+        参数：
+            idx_page: 页面下标
+            offset: 文字在页面内容中的起始位置
+            length: 文字长度
+        返回值：
+            sentence_id: 句子在所有句子中的下标, 文字不完整地在一个句子中时返回None
+        """
+        low, high = self.page_starts[idx_page], self.page_starts[idx_page + 1]
+        sentence_id = bisect_right(self.ends, offset, low, high) # 句子首尾相接, 第一个结束位置在offset之后的句子
+        if sentence_id < high and offset + length <= self.ends[sentence_id]:
+            return sentence_id
+        return None
+
+    def get_window(self, sentence_id, idx_page, sentence_number):
+        """
+        描述：
+            获取句子前后一共 sentence_number 句话的下标, 句子前面取 sentence_number // 2 句
+            当前页不足时从上一页的末尾、下一页的开头补充, 最多跨到相邻的一页
+        参数：
+            sentence_id: 句子在所有句子中的下标
+            idx_page: 句子所在的页面下标
+            sentence_number: 句子数
+        返回值：
+            sentence_ids: range 句子下标
+        """
+        start = max(sentence_id - sentence_number // 2, self.page_starts[max(idx_page - 1, 0)])
+        end = min(sentence_id + sentence_number - sentence_number // 2, self.page_starts[min(idx_page + 2, self.page_count)])
+        return range(start, end)
+
+    def get_paragraph(self, sentence_ids, separator=""):
+        """
+        描述：把句子拼接成段落
+        参数：
+            sentence_ids: 句子下标
+            separator: 句子之间的分隔符
+        返回值：
+            paragraph: Paragraph
+        """
+        sentences = [self.sentences[sentence_id] for sentence_id in sentence_ids]
+        return Paragraph(separator.join(sentences), sentences, sentence_ids, self)
+
+    def index_tokens(self, sentence_ids):
+        """
+        描述：对还没有加入倒排索引的句子分词并加入索引, 分词前去除句子首尾的空白
+        参数：
+            sentence_ids: 句子下标
+        """
+        tokenizer = get_tokenizer()
+        for sentence_id in sentence_ids:
+            if sentence_id in self.indexed:
+                continue
+            for word in set(tokenizer.cut(self.sentences[sentence_id].strip())):
+                self.postings[word].add(sentence_id)
+            self.indexed.add(sentence_id)
+
+    def match(self, keyword_groups):
+        """
+        描述：
+            查找每一组关键词中都至少有一个出现在分词结果中的句子
+            每一组取倒排列表的并集, 组之间取交集, 耗时与命中的句子数有关, 与关键词组合的数量无关
+            空字符串总是出现在分词结果中, 包含空字符串的组不限制结果
+        参数：
+            keyword_groups: List[List[关键词]]
+        返回值：
+            sentence_ids: set 匹配的句子下标, 只包含已经加入倒排索引的句子
+        """
+        result = None
+        for keywords in keyword_groups:
+            if "" in keywords:
+                continue
+            sentence_ids = set().union(*[self.postings.get(word, ()) for word in keywords])
+            result = sentence_ids if result is None else result & sentence_ids
+        return set(self.indexed) if result is None else result
+
+
+def get_sentence_index(document_info):
+    """
+    描述：获取文档的句子索引, Document 的索引只构建一次并保存在 Document 中
+    参数：
+        document_info: Document 或 List[page_info]
+    返回值：
+        sentence_index: SentenceIndex
+    """
+    if getattr(document_info, "sentence_index", None) is None:
+        sentence_index = SentenceIndex(document_info)
+        if not hasattr(document_info, "sentence_index"):
+            return sentence_index
+        document_info.sentence_index = sentence_index
+    return document_info.sentence_index
@@ -0,0 +1,131 @@
+'''
+TimeEstimator类
+根据实际处理的耗时校准PDF处理时间的估计, 校准数据保存在本地
+'''
+import os
+import json
+import threading
+from collections import defaultdict
+
+from common.custom.logger import my_logger
+
+
+class TimeEstimator():
+    '''
+    描述：
+        按页面类别(见 PdfProcessor.get_timing_category)统计每一页的平均耗时, 估计PDF的处理时间
+        每处理完一个PDF, 用指数滑动平均更新每一类的平均耗时,
+        以及文档实际耗时与每页耗时之和的比例(流水线、多进程并行的程度)
+        全部页面来自缓存时耗时主要是固定开销, 不更新该比例
+    参数：
+        filepath: 保存校准数据的JSON文件路径
+        alpha: 指数滑动平均中新数据的权重
+    '''
+    # 没有校准数据时每一类页面的耗时(秒)
+    default_page_time = {
+        "cached": 0.05,
+        "skipped": 0.5,
+        "text:single": 3.0,
+        "text:double": 5.0,
+        "ocr:single": 15.0,
+        "ocr:double": 25.0,
+    }
+
+    def __init__(self, filepath, alpha=0.2) -> None:
+        self.filepath = filepath
+        self.alpha = alpha
+        self.lock = threading.Lock()
+        self.page_time = dict(self.default_page_time) # 每一类页面的平均耗时(秒)
+        self.sample_count = {} # 每一类页面已经统计的页数
+        self.overlap = 1.0 # 文档实际耗时 / 每页耗时之和
+        self.load()
+
+    def load(self):
+        """
+        描述：读取校准数据, 文件不存在或损坏时使用默认值
+        """
+        if not os.path.exists(self.filepath):
+            return
+        try:
+            with open(self.filepath, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            self.page_time.update(data["page_time"])
+            self.sample_count.update(data["sample_count"])
+            self.overlap = data["overlap"]
+        except Exception as e:
+            my_logger.warning(f"读取处理时间校准数据 {self.filepath} 失败: {str(e)}")
+
+    def save(self):
+        """
+        描述：保存校准数据, 先写临时文件再替换, 避免写入中断时损坏
+        """
+        data = {"page_time": self.page_time, "sample_count": self.sample_count, "overlap": self.overlap}
+        temp_path = f"{self.filepath}.tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False, indent=4)
+        os.replace(temp_path, self.filepath)
+
+    def update(self, old, new, count):
+        """
+        描述：指数滑动平均, 还没有样本时直接使用新数据
+        """
+        return new if count == 0 else (1 - self.alpha) * old + self.alpha * new
+
+    def record(self, page_timings, elapsed):
+        """
+        描述：用一个PDF的实际耗时更新校准数据
+        参数：
+            page_timings: List[(类别, 秒)] PdfProcessor.page_timings
+            elapsed: 处理整个PDF的实际耗时(秒), 不包括与页面处理无关的固定开销
+        """
+        if len(page_timings) == 0:
+            return
+        category_times = defaultdict(list) # {类别: [每一页的耗时]}
+        for category, seconds in page_timings:
+            category_times[category].append(seconds)
+        total = sum([seconds for _, seconds in page_timings])
+
+        with self.lock:
+            for category, times in category_times.items():
+                count = self.sample_count.get(category, 0)
+                self.page_time[category] = self.update(self.page_time.get(category, 0.0), sum(times) / len(times), count)
+                self.sample_count[category] = count + len(times)
+            has_processed = any([category != "cached" for category in category_times])
+            if has_processed and total > 0 and elapsed > 0:
+                documents = self.sample_count.get("documents", 0)
+                self.overlap = self.update(self.overlap, elapsed / total, documents)
+                self.sample_count["documents"] = documents + 1
+            try:
+                self.save()
+            except Exception as e:
+                my_logger.warning(f"保存处理时间校准数据 {self.filepath} 失败: {str(e)}")
+
+    def estimate(self, categories):
+        """
+        描述：估计处理时间
+        参数：
+            categories: List[str] 每一页的类别, PdfProcessor.get_page_categories
+        返回值：
+            seconds: float 预计耗时(秒)
+        """
+        with self.lock:
+            total = sum([self.page_time.get(category, self.default_page_time["ocr:single"]) for category in categories])
+            return total * self.overlap
+
+
+# 进程内共享的TimeEstimator
+time_estimators = {} # {文件路径: TimeEstimator}
+time_estimators_lock = threading.Lock()
+
+def get_time_estimator(filepath):
+    """
+    描述：获取进程内共享的TimeEstimator, 同一个文件只读取一次
+    参数：
+        filepath: 保存校准数据的JSON文件路径
+    返回值：
+        estimator: TimeEstimator
+    """
+    with time_estimators_lock:
+        if filepath not in time_estimators:
+            time_estimators[filepath] = TimeEstimator(filepath)
+        return time_estimators[filepath]
@@ -0,0 +1,147 @@
+'''
+Tokenizer类
+jieba分词的缓存服务, 同一个句子在不同指标、不同文档中只分词一次
+'''
+import os
+import jieba
+import pickle
+import hashlib
+import threading
+from collections import OrderedDict
+
+from common.custom.logger import my_logger
+
+
+class Tokenizer():
+    '''
+    描述：
+        带LRU缓存的jieba分词
+        缓存的键为 (分词模式, 句子的哈希), 值为分词结果的tuple, 超过 max_size 个句子时删除最久未使用的
+        path 不为空时从文件读取缓存, save 时写回, 不同进程、不同次运行之间共用
+    参数：
+        max_size: 最多缓存的句子数
+        path: 缓存文件路径, None表示不保存
+    '''
+    modes = ("default", "search") # default: jieba.lcut 精确模式, search: jieba.cut_for_search 搜索引擎模式
+
+    def __init__(self, max_size=200000, path=None) -> None:
+        self.max_size = max_size
+        self.path = path
+        self.cache = OrderedDict() # {(模式, 句子哈希): 分词结果}
+        self.lock = threading.Lock()
+        self.hits = 0 # 命中缓存的次数
+        self.misses = 0 # 没有命中缓存的次数
+        self.load()
+
+    def get_key(self, sentence, mode):
+        """
+        描述：缓存的键, 使用与进程无关的哈希, 保存后下次运行仍然有效
+        """
+        return mode, hashlib.blake2b(sentence.encode("utf-8"), digest_size=16).digest()
+
+    def cut(self, sentence, mode="default"):
+        """
+        描述：分词, 结果与 jieba.lcut(sentence) 或 jieba.cut_for_search(sentence) 相同
+        参数：
+            sentence: str 句子
+            mode: default 或 search
+        返回值：
+            words: tuple 分词结果
+        """
+        if mode not in self.modes:
+            raise ValueError(f"分词模式 {mode} 不合法")
+        key = self.get_key(sentence, mode)
+        with self.lock:
+            words = self.cache.get(key)
+            if words is not None:
+                self.cache.move_to_end(key)
+                self.hits += 1
+                return words
+            self.misses += 1
+
+        if mode == "default":
+            words = tuple(jieba.lcut(sentence, cut_all=False))
+        else:
+            words = tuple(jieba.cut_for_search(sentence))
+
+        with self.lock:
+            self.cache[key] = words
+            while len(self.cache) > self.max_size:
+                self.cache.popitem(last=False)
+        return words
+
+    def cut_lines(self, text):
+        """
+        描述：
+            对多行文本精确模式分词, 每一行分别使用缓存
+            jieba 在换行符处切分文本, 结果与 jieba.lcut(text) 相同
+        参数：
+            text: str 用换行符拼接的句子
+        返回值：
+            words: list 分词结果
+        """
+        words = []
+        for idx, line in enumerate(text.split("\n")):
+            if idx > 0:
+                words.append("\n")
+            words += self.cut(line)
+        return words
+
+    def get_stats(self):
+        """
+        描述：缓存统计
+        返回值：
+            stats: {"hits": 命中次数, "misses": 未命中次数, "hit_rate": 命中率, "size": 缓存的句子数}
+        """
+        with self.lock:
+            total = self.hits + self.misses
+            return {"hits": self.hits, "misses": self.misses, "hit_rate": self.hits / total if total else 0.0, "size": len(self.cache)}
+
+    def load(self):
+        """
+        描述：从文件读取缓存, 文件不存在或损坏时从空缓存开始
+        """
+        if not self.path or not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, "rb") as f:
+                cache = pickle.load(f)
+            with self.lock:
+                self.cache.update(cache)
+                while len(self.cache) > self.max_size:
+                    self.cache.popitem(last=False)
+        except Exception as e:
+            my_logger.warning(f"读取分词缓存 {self.path} 失败: {str(e)}")
+
+    def save(self):
+        """
+        描述：保存缓存, 先写临时文件再替换, 避免写入中断时损坏
+        """
+        if not self.path:
+            return
+        with self.lock:
+            cache = OrderedDict(self.cache)
+        temp_path = f"{self.path}.{os.getpid()}.{threading.get_ident()}.tmp" # 多个线程、进程同时保存时互不影响
+        with open(temp_path, "wb") as f:
+            pickle.dump(cache, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(temp_path, self.path)
+
+
+# 进程内共享的Tokenizer
+tokenizer = None
+tokenizer_lock = threading.Lock()
+
+def get_tokenizer(max_size=200000, path=None):
+    """
+    描述：获取进程内共享的Tokenizer, 参数只在第一次调用时生效
+    参数：
+        max_size: 最多缓存的句子数
+        path: 缓存文件路径, None表示不保存
+    返回值：
+        tokenizer: Tokenizer
+    """
+    global tokenizer
+    with tokenizer_lock:
+        if tokenizer is None:
+            tokenizer = Tokenizer(max_size, path)
+        return tokenizer
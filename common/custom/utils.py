@@ -1,10 +1,65 @@
+import os
 import cv2
+import hashlib
 import numpy as np
 
 def cv2imread(img_path):
     # 读取图像，解决imread不能读取中文路径的问题  
     return cv2.imdecode(np.fromfile(img_path, dtype=np.uint8), -1)
 
+def pixmap_to_array(pix):
+    """
+    描述：
+        把PyMuPDF的Pixmap转换为OpenCV格式(BGR)的图像
+        直接使用Pixmap的像素缓冲区, 不经过PNG编码、解码和磁盘读写
+    参数：
+        pix: fitz.Pixmap 灰度或RGB(A)
+    返回值：
+        img: np.ndarray (height, width, 3) BGR图像
+    """
+    # samples_mv 不复制像素数据, 旧版本PyMuPDF没有时使用 samples
+    samples = pix.samples_mv if hasattr(pix, "samples_mv") else pix.samples
+    img = np.frombuffer(samples, dtype=np.uint8).reshape(pix.height, pix.width, pix.n)
+    # 转换颜色空间时生成新的数组, 之后不再依赖Pixmap的内存
+    if pix.n == 1:
+        return cv2.cvtColor(img, cv2.COLOR_GRAY2BGR)
+    elif pix.n == 4:
+        return cv2.cvtColor(img, cv2.COLOR_RGBA2BGR)
+    return cv2.cvtColor(img, cv2.COLOR_RGB2BGR)
+
+
+def get_file_hash(filepath, chunk_size=1024*1024):
+    """
+    描述：计算文件内容的SHA256, 用于标识同一份PDF
+    参数：
+        filepath: 文件路径
+        chunk_size: 每次读取的字节数
+    返回值：
+        hash: str 十六进制的SHA256
+    """
+    sha256 = hashlib.sha256()
+    with open(filepath, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            sha256.update(chunk)
+    return sha256.hexdigest()
+
+def get_resident_memory():
+    """
+    描述：获取当前进程占用的物理内存(RSS)
+    返回值：
+        memory: int 字节数
+    """
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        pass
+    try:
+        # 没有/proc的系统, 使用进程的峰值内存代替
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+    except ImportError:
+        return 0 # Windows
 
 def remove_duplicate(list_1):
     # 去重后还是原list顺序
@@ -30,3 +85,127 @@ def check_pno(pno_start, pno_end):
 
     if pno_start > pno_end:
         raise ValueError("pno_start can not large than pno_end")
+
+def get_containment_matrix(bboxes, boxes, error_axis_x=50, error_axis_y=2):
+    """
+    描述：
+        批量判断bboxes中的每一个Bbox是否在boxes中的每一个Box内, 判断规则同 PdfProcessor.is_in_bboxes
+        使用NumPy广播一次完成所有判断
+    参数：
+        bboxes: Bbox List 或 np.ndarray (n, 4) [左上角x，左上角y，右下角x，右下角y]
+        boxes: Box List 或 np.ndarray (m, 4)
+        error_axis_x: x轴允许误差
+        error_axis_y: y轴允许误差
+    返回值：
+        inside: np.ndarray (n, m) bool, inside[i, j] 表示 bboxes[i] 在 boxes[j] 内
+    """
+    bboxes = np.asarray(bboxes, dtype=np.float64).reshape(-1, 4)
+    boxes = np.asarray(boxes, dtype=np.float64).reshape(-1, 4)
+    # 添加允许误差
+    error = np.array([error_axis_x, error_axis_y, -error_axis_x, -error_axis_y], dtype=np.float64)
+    bboxes = bboxes + error
+    boxes = boxes - error
+    inside = (bboxes[:, None, 0] >= boxes[None, :, 0]) & (bboxes[:, None, 1] >= boxes[None, :, 1])
+    inside &= (bboxes[:, None, 2] <= boxes[None, :, 2]) & (bboxes[:, None, 3] <= boxes[None, :, 3])
+    return inside
+
+def is_single_column_points(middle_points, axis=50):
+    """
+    描述：
+        根据版面块的中心点判断是否为单栏页面
+        按纵坐标排序后, 相邻两个块纵坐标差值小于误差且横坐标差值大于误差, 则判断为多栏
+    参数：
+        middle_points: 中心点 List[(x, y)] 或 np.ndarray (n, 2)
+        axis: 误差值
+    返回值：
+        True: 单栏页面
+        False: 多栏页面
+    """
+    middle_points = np.asarray(middle_points, dtype=np.float64).reshape(-1, 2)
+    if len(middle_points) < 2:
+        return True
+    order = np.argsort(middle_points[:, 1], kind="stable") # 按照纵坐标升序
+    diff = np.diff(middle_points[order], axis=0) # 相邻两个块的坐标差值
+    return not np.any((diff[:, 1] <= axis) & (diff[:, 0] >= axis))
+
+def get_column_ids(bboxes, axis=50, span_ratio=0.6):
+    """
+    描述：
+        判断每个版面块所在的栏
+        单栏页面(判断规则同 is_single_column_points)所有块都在第0栏
+        多栏页面按左边界从左到右扫描, 与前面的块横向范围不重叠时开始新的一栏
+        宽度超过所有块横向范围 span_ratio 的块(例如通栏标题)横跨多栏, 栏号为-1
+    参数：
+        bboxes: Bbox List 或 np.ndarray (n, 4) [左上角x，左上角y，右下角x，右下角y]
+        axis: 单栏判断的误差值
+        span_ratio: 横跨多栏的宽度比例
+    返回值：
+        column_ids: np.ndarray (n,) int, 栏号从左到右为0, 1, 2...
+    """
+    bboxes = np.asarray(bboxes, dtype=np.float64).reshape(-1, 4)
+    column_ids = np.zeros(len(bboxes), dtype=np.int64)
+    middle_points = (bboxes[:, :2] + bboxes[:, 2:]) * 0.5
+    if is_single_column_points(middle_points, axis=axis):
+        return column_ids
+
+    width = bboxes[:, 2].max() - bboxes[:, 0].min()
+    spanning = (bboxes[:, 2] - bboxes[:, 0]) > width * span_ratio
+    column_ids[spanning] = -1
+    idx = np.flatnonzero(~spanning)
+    if len(idx) == 0:
+        return column_ids
+
+    idx = idx[np.argsort(bboxes[idx, 0], kind="stable")] # 按左边界升序
+    right = np.maximum.accumulate(bboxes[idx, 2]) # 前面所有块的最右边界
+    new_column = np.concatenate([[False], bboxes[idx[1:], 0] > right[:-1]])
+    column_ids[idx] = np.cumsum(new_column)
+    return column_ids
+
+def sort_structure(structure):
+    """
+    描述：
+        计算每个版面块的中心点坐标，并按中心点坐标排序
+        先按y轴升序，y轴相同按x轴升序, x轴、y轴坐标都除以100，根据百位数字进行排序
+    参数：
+        structure: 版面分析结果 List[Dict]
+    返回值：
+        structure: 排序后的版面分析结果 List[Dict]
+    """
+    for item in structure:
+        item["middle_point"] = ((item["bbox"][0] + item["bbox"][2])*0.5, (item["bbox"][1] + item["bbox"][3])*0.5)
+    return sorted(structure, key=lambda x: ((x["middle_point"][1] // 100), (x["middle_point"][0] // 100)))
+
+def get_rect_clusters(rects, width, height, tolerance=3, cell=2):
+    """
+    描述：
+        把相交或距离小于 tolerance 的矩形合并为一组
+        矩形画到 cell 大小的网格上, 用连通域代替两两比较, 复杂度与矩形数量成线性关系
+    参数：
+        rects: np.ndarray (n, 4) [左上角x，左上角y，右下角x，右下角y], 坐标范围 [0, width] x [0, height]
+        width: 坐标范围的宽度
+        height: 坐标范围的高度
+        tolerance: 合并的距离
+        cell: 网格大小
+    返回值：
+        clusters: List[(bbox [x0, y0, x1, y1], 矩形数量)]
+    """
+    rects = np.asarray(rects, dtype=np.float64).reshape(-1, 4)
+    if len(rects) == 0:
+        return []
+    grid_w, grid_h = int(np.ceil(width / cell)) + 1, int(np.ceil(height / cell)) + 1
+    cells = np.floor(np.stack([rects[:, 0] - tolerance, rects[:, 1] - tolerance, rects[:, 2] + tolerance, rects[:, 3] + tolerance], axis=1) / cell).astype(np.int64)
+    cells[:, [0, 2]] = np.clip(cells[:, [0, 2]], 0, grid_w - 1)
+    cells[:, [1, 3]] = np.clip(cells[:, [1, 3]], 0, grid_h - 1)
+    grid = np.zeros((grid_h, grid_w), dtype=np.uint8)
+    for x0, y0, x1, y1 in cells:
+        grid[y0:y1 + 1, x0:x1 + 1] = 1
+    _, labels = cv2.connectedComponents(grid, connectivity=8)
+
+    # 每个矩形左上角所在的连通域
+    rect_labels = labels[cells[:, 1], cells[:, 0]]
+    clusters = []
+    for label in np.unique(rect_labels):
+        members = rects[rect_labels == label]
+        bbox = [members[:, 0].min(), members[:, 1].min(), members[:, 2].max(), members[:, 3].max()]
+        clusters.append((bbox, len(members)))
+    return clusters
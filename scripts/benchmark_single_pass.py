@@ -0,0 +1,72 @@
+"""
+对比单次识别(single_pass)与两次识别(PPStructure + 整页PaddleOCR)的文本和耗时
+用法: python benchmark_single_pass.py PDF文件夹 [每个PDF最多测试的页数]
+"""
+import os
+import sys
+import time
+import difflib
+
+if True:
+    current_path = os.path.abspath(os.path.dirname(__file__))
+    superior_path = os.path.join(current_path, "..")
+    sys.path.append(superior_path)
+    from common.custom.logger import Log
+    from common.custom.pdf_processor import PdfProcessor
+
+
+def benchmark_pdf(filepath, media_root, max_pages):
+    """
+    描述：
+        对一个PDF的每一页分别用两种方式提取文本, 统计文本相似度和耗时
+        所有页面都按OCR页面处理, 不使用文本层
+    返回值：
+        result: {"pages", "ratio", "structure_time", "ocr_time", "exact"}
+    """
+    pdf = PdfProcessor(filepath, media_root)
+    result = {"pages": 0, "ratio": 0.0, "structure_time": 0.0, "ocr_time": 0.0, "exact": 0}
+    for pno, page in enumerate(pdf.documnet):
+        if pno >= max_pages:
+            break
+        img = pdf.render_page(pno, page)
+
+        start = time.time()
+        structure = pdf.pdf_ocr.get_structure(img)
+        result["structure_time"] += time.time() - start
+        single_pass_content = pdf.get_content_by_PPStructure(structure)
+
+        # 两次识别时额外的整页OCR耗时
+        error_axis_x = 50 if pdf.is_single_colum(structure=structure) else 5
+        start = time.time()
+        two_pass_content = pdf.get_content_by_PaddleOCR(structure, img, error_axis_x)
+        result["ocr_time"] += time.time() - start
+
+        result["pages"] += 1
+        result["ratio"] += difflib.SequenceMatcher(None, single_pass_content, two_pass_content).ratio()
+        result["exact"] += int(single_pass_content == two_pass_content)
+    pdf.close_pdfplumber()
+    return result
+
+
+if __name__ == '__main__':
+    my_logger = Log()
+    pdf_base_path = sys.argv[1] if len(sys.argv) > 1 else './media/uploads'
+    max_pages = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+    media_root = os.path.join(superior_path, "media")
+
+    total = {"pages": 0, "ratio": 0.0, "structure_time": 0.0, "ocr_time": 0.0, "exact": 0}
+    for filename in sorted(os.listdir(pdf_base_path)):
+        if not filename.lower().endswith(".pdf"):
+            continue
+        result = benchmark_pdf(os.path.join(pdf_base_path, filename), media_root, max_pages)
+        if result["pages"] == 0:
+            continue
+        for key in total:
+            total[key] += result[key]
+        my_logger.info(f"{filename}: {result['pages']}页, 平均相似度 {result['ratio'] / result['pages']:.4f}, "
+                       f"完全一致 {result['exact']}页, 单次识别 {result['structure_time']:.1f}s, 额外整页OCR {result['ocr_time']:.1f}s")
+
+    if total["pages"]:
+        saving = total["ocr_time"] / (total["structure_time"] + total["ocr_time"])
+        my_logger.info(f"合计 {total['pages']}页, 平均相似度 {total['ratio'] / total['pages']:.4f}, "
+                       f"完全一致 {total['exact']}页, 单次识别节省 {saving:.1%} 的推理时间")
@@ -0,0 +1,81 @@
+"""
+对比不同渲染缩放比例下的OCR速度和文字召回率
+以有文本层的PDF页面的文本层作为标准答案, 所有页面强制按OCR页面处理
+用法: python benchmark_zoom.py PDF文件夹 [每个PDF最多测试的页数]
+"""
+import os
+import sys
+import time
+from collections import Counter
+
+if True:
+    current_path = os.path.abspath(os.path.dirname(__file__))
+    superior_path = os.path.join(current_path, "..")
+    sys.path.append(superior_path)
+    from common.custom.logger import Log
+    from common.custom.pdf_processor import PdfProcessor, clean_content
+
+# 固定缩放比例, "adaptive" 表示自适应分辨率
+ZOOM_LEVELS = [1.0, 1.5, 2.0, 2.5, "adaptive"]
+
+
+def get_recall(content, reference):
+    """
+    描述：字符召回率, 标准答案中的字符有多少被识别出来(不考虑顺序)
+    """
+    if len(reference) == 0:
+        return 1.0
+    matched = sum((Counter(content) & Counter(reference)).values())
+    return matched / len(reference)
+
+
+def benchmark_pdf(filepath, media_root, zoom, max_pages):
+    """
+    描述：用指定的缩放比例处理一个PDF的有文本层的页面
+    返回值：
+        result: {"pages", "time", "recall"}
+    """
+    pdf = PdfProcessor(filepath, media_root)
+    if zoom == "adaptive":
+        pdf.adaptive_zoom = True
+    else:
+        pdf.set_options({"zoom_x": zoom, "zoom_y": zoom})
+
+    result = {"pages": 0, "time": 0.0, "recall": 0.0}
+    for pno, page in enumerate(pdf.documnet):
+        if result["pages"] >= max_pages:
+            break
+        if not pdf.has_text_layer(page):
+            continue
+        reference = clean_content(page.get_text("text"))
+
+        start = time.time()
+        pdf.use_text_layer = False
+        page_info = pdf.extract_page(pno)
+        pdf.use_text_layer = True
+        result["time"] += time.time() - start
+
+        result["pages"] += 1
+        result["recall"] += get_recall(page_info["content"], reference)
+    pdf.close_pdfplumber()
+    return result
+
+
+if __name__ == '__main__':
+    my_logger = Log()
+    pdf_base_path = sys.argv[1] if len(sys.argv) > 1 else './media/uploads'
+    max_pages = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+    media_root = os.path.join(superior_path, "media")
+    filenames = sorted([filename for filename in os.listdir(pdf_base_path) if filename.lower().endswith(".pdf")])
+
+    for zoom in ZOOM_LEVELS:
+        total = {"pages": 0, "time": 0.0, "recall": 0.0}
+        for filename in filenames:
+            result = benchmark_pdf(os.path.join(pdf_base_path, filename), media_root, zoom, max_pages)
+            for key in total:
+                total[key] += result[key]
+        if total["pages"] == 0:
+            my_logger.warning("没有可用于测试的有文本层的页面")
+            break
+        my_logger.info(f"缩放比例 {zoom}: {total['pages']}页, {total['pages'] / total['time']:.2f} 页/秒, "
+                       f"平均召回率 {total['recall'] / total['pages']:.4f}")
@@ -0,0 +1,47 @@
+'''
+PdfProcessor 的测试
+pdf_processor 导入时需要 paddleocr, 没有安装时跳过
+'''
+import unittest
+import importlib.util
+
+import numpy as np
+
+
+@unittest.skipUnless(importlib.util.find_spec("paddleocr"), "需要安装paddleocr")
+class GutterTest(unittest.TestCase):
+    '''
+    描述：双页图片的中缝检测
+    '''
+    def setUp(self):
+        from common.custom.pdf_processor import PdfProcessor
+        self.pdf = PdfProcessor.__new__(PdfProcessor) # 不打开PDF, get_gutter 只使用 gutter_search_ratio
+        self.pdf.gutter_search_ratio = 0.1
+
+    def get_spread(self, height=1000, width=2400, gutter=1200):
+        """
+        描述：生成左右两页都是文字行的双页图片, 中缝处没有墨迹
+        """
+        img = np.full((height, width, 3), 255, dtype=np.uint8)
+        img[100:900:10, 100:gutter - 50] = 0
+        img[100:900:10, gutter + 50:width - 100] = 0
+        return img
+
+    def test_blank_gutter(self):
+        img = self.get_spread(gutter=1150)
+        self.assertLess(abs(self.pdf.get_gutter(img) - 1150), 50)
+
+    def test_inked_gutter(self):
+        # 跨页图片覆盖中缝, 占页面高度的 20%, 中缝仍然是墨迹最少的位置, 不能落在搜索范围的边缘
+        img = self.get_spread()
+        img[400:600, 900:1500] = 0
+        self.assertLess(abs(self.pdf.get_gutter(img) - 1200), 50)
+
+    def test_fully_inked_gutter(self):
+        # 整页都是图片时返回中线
+        img = np.zeros((1000, 2400, 3), dtype=np.uint8)
+        self.assertEqual(self.pdf.get_gutter(img), 1200)
+
+
+if __name__ == "__main__":
+    unittest.main()